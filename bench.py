@@ -0,0 +1,422 @@
+"""Бенчмарки бота. Запуск: python bench.py <команда> --help"""
+import os
+import time
+import asyncio
+import argparse
+
+# ================= ПАРСИНГ PDF =================
+
+def load_fixtures(fixtures_dir):
+    pdfs = [os.path.join(fixtures_dir, name) for name in sorted(os.listdir(fixtures_dir)) if name.lower().endswith(".pdf")]
+    if not pdfs: raise SystemExit(f"В {fixtures_dir} нет PDF")
+    return pdfs
+
+async def _parse_all(pdfs, executor):
+    from engine import parse_pdf_content
+    return await asyncio.gather(*(parse_pdf_content(path, executor) for path in pdfs))
+
+def bench_parse(args):
+    """Время парсинга N PDF для каждого режима исполнителя и числа воркеров"""
+    from engine import make_executor
+    pdfs = load_fixtures(args.fixtures)
+    print(f"PDF: {len(pdfs)}, повторов: {args.repeat}")
+    print(f"{'режим':<10} {'воркеры':>7} {'сек':>8}")
+    for mode in ("inline", "threads", "processes"):
+        for workers in ((1,) if mode == "inline" else args.workers):
+            executor = make_executor(mode, workers)
+            try:
+                #прогрев: запуск процессов и импорт pdfplumber в них не входит в замер
+                asyncio.run(_parse_all(pdfs[:1], executor))
+                best = None
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    asyncio.run(_parse_all(pdfs, executor))
+                    elapsed = time.perf_counter() - t0
+                    best = elapsed if best is None else min(best, elapsed)
+            finally:
+                if executor is not None: executor.shutdown()
+            print(f"{mode:<10} {workers:>7} {best:>8.2f}")
+
+def bench_extract(args):
+    """Скорость извлечения таблиц (страниц/с) и пиковая память на наборе PDF: холодный и теплый кеш страниц"""
+    import tracemalloc
+    import pdfplumber
+    import parser
+
+    pdfs = load_fixtures(args.fixtures)
+    for run in ("холодный кеш", "теплый кеш"):
+        if run == "холодный кеш": parser._page_tables_cache.clear()
+        pages = 0
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        for path in pdfs:
+            with pdfplumber.open(path) as pdf:
+                pages += len(pdf.pages)
+                parser.extract_pages(pdf.pages, parser.empty_groups_data())
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{run:<13} страниц: {pages}, {pages / elapsed:>7.1f} стр/с, пик памяти {peak / 2**20:.1f} МиБ")
+
+# ================= БАЗА ДАННЫХ =================
+
+def bench_db(args):
+    """Накладные расходы базы на один /start: соединение на каждый вызов против общего соединения"""
+    import sqlite3
+    import tempfile
+    import database
+
+    tmp_dir = tempfile.mkdtemp()
+    database.DB_FILE = os.path.join(tmp_dir, "bench.db")
+    database.init_db()
+    for uid in range(args.users):
+        database.grant_access(uid)
+
+    def start_old_style(uid):
+        #как было: отдельный sqlite3.connect на каждую функцию
+        for sql, params in (
+            ('SELECT use_new_style FROM users WHERE user_id = ?', (uid,)),
+            ('SELECT is_allowed FROM users WHERE user_id = ?', (uid,)),
+            ('INSERT INTO users (user_id, is_allowed) VALUES (?, 1) ON CONFLICT(user_id) DO UPDATE SET is_allowed = 1', (uid,)),
+            ('SELECT group_name FROM users WHERE user_id = ?', (uid,)),
+        ):
+            with sqlite3.connect(database.DB_FILE) as conn:
+                conn.execute(sql, params).fetchall()
+                conn.commit()
+
+    def start_pooled(uid):
+        database.get_user_style(uid)
+        database.check_access(uid)
+        database.grant_access(uid)
+        database.get_user_group(uid)
+
+    async def start_async(uid):
+        await database.run_db(database.get_user_style, uid)
+        await database.run_db(database.check_access, uid)
+        await database.run_db(database.grant_access, uid)
+        await database.run_db(database.get_user_group, uid)
+
+    async def run_async(n):
+        for i in range(n): await start_async(i % args.users)
+
+    for name, run in (
+        ("connect на вызов", lambda n: [start_old_style(i % args.users) for i in range(n)]),
+        ("общее соединение", lambda n: [start_pooled(i % args.users) for i in range(n)]),
+        ("общее + run_db", lambda n: asyncio.run(run_async(n))),
+    ):
+        t0 = time.perf_counter()
+        run(args.requests)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<18} {elapsed / args.requests * 1e6:>9.1f} мкс/запрос")
+    database.close_db()
+
+# ================= ХРАНИЛИЩЕ РАСПИСАНИЯ =================
+
+def synthetic_schedule(groups, seed):
+    """Расписание как после парсинга: новые строки на каждый вызов, как у свежего PDF"""
+    import random
+    rnd = random.Random(seed)
+    subjects = [f"Дисциплина {i} (лекция) Преподаватель {i % 17} ауд. {100 + i}" for i in range(60)]
+    return {
+        f"Б-{g:03}": {w: {d: {p: "".join(list(rnd.choice(subjects))) for p in range(1, rnd.randint(2, 6))} for d in range(6)} for w in (0, 1)}
+        for g in range(groups)
+    }
+
+def bench_store(args):
+    """Память на N хранимых версий расписания: копии словарей против замороженных версий с общими днями"""
+    import tracemalloc
+    from store import ScheduleStore
+
+    def versions():
+        #каждая следующая версия - свежий разбор с одной измененной ячейкой
+        for v in range(args.versions):
+            data = synthetic_schedule(args.groups, seed=1)
+            data[sorted(data)[v % len(data)]][0][0][1] = f"Перенос {v}"
+            yield data
+
+    for name in ("копии словарей", "ScheduleStore"):
+        gen = versions()
+        tracemalloc.start()
+        if name == "ScheduleStore":
+            store = ScheduleStore(history_size=args.versions)
+            for data in gen: store.publish(data, None)
+            del data
+        else:
+            kept = list(gen)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:<15} версий: {args.versions}, удерживается {current / 2**20:>7.1f} МиБ")
+
+    store = ScheduleStore()
+    store.publish(synthetic_schedule(args.groups, seed=1), None)
+    t0 = time.perf_counter()
+    for _ in range(args.reads):
+        cur = store.current
+        cur.data[next(iter(cur.data))][0].get(0)
+    print(f"чтение текущей версии: {(time.perf_counter() - t0) / args.reads * 1e9:.0f} нс")
+
+# ================= НАГРУЗКА НА БОТА (ЗАГЛУШКИ BOT API И САЙТА) =================
+
+def percentile(values, q):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def patch_config_for_fakes(api_port, site_port, tmp_dir, executor="inline"):
+    """Настройки бота на локальные заглушки. Вызывать до импорта модулей бота"""
+    import config
+    config.BOT_TOKEN = "1:fake"
+    config.ADMIN_ID = 1
+    config.SCHEDULE_URL = f"http://127.0.0.1:{site_port}/schedule"
+    config.SCHEDULE_SEED_URLS = [config.SCHEDULE_URL]
+    config.CRAWL_SCOPE = [f"http://127.0.0.1:{site_port}/"]
+    config.SEARCH_QUERY_PDF = ""
+    config.DB_FILE = os.path.join(tmp_dir, "bench.db")
+    config.SNAPSHOT_FILE = os.path.join(tmp_dir, "snapshot.json.gz")
+    config.PARSE_EXECUTOR = executor
+    #заглушка не ограничивает частоту - меряем сам бот, а не лимиты Telegram
+    config.BROADCAST_RATE = 10**6
+    config.BROADCAST_CHAT_INTERVAL = 0
+    config.METRICS_ENABLED = True
+    return f"http://127.0.0.1:{api_port}/bot"
+
+class SimUpdates:
+    """Фабрика апдейтов Telegram от имитируемых пользователей"""
+
+    def __init__(self):
+        self.ids = iter(range(1, 10**9))
+
+    def _user(self, uid):
+        return {"id": uid, "is_bot": False, "first_name": f"user{uid}"}
+
+    def message(self, uid, text):
+        msg = {"message_id": next(self.ids), "date": int(time.time()), "text": text,
+               "chat": {"id": uid, "type": "private"}, "from": self._user(uid)}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self.ids), "message": msg}
+
+    def callback(self, uid, data):
+        msg = {"message_id": next(self.ids), "date": int(time.time()), "text": "...",
+               "chat": {"id": uid, "type": "private"}, "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"}}
+        return {"update_id": next(self.ids), "callback_query": {
+            "id": str(next(self.ids)), "from": self._user(uid), "chat_instance": str(uid), "data": data, "message": msg}}
+
+async def _load(args):
+    import datetime
+    import tempfile
+    from fakes import FakeBotAPI, FakeSite, serve_http
+
+    api, site = FakeBotAPI(), FakeSite(args.fixtures)
+    api_server, api_port = await serve_http(api.handle)
+    site_server, site_port = await serve_http(site.handle)
+    base_url = patch_config_for_fakes(api_port, site_port, tempfile.mkdtemp(), args.executor)
+
+    from telegram import Update
+    import config
+    import database
+    import tasks
+    from broadcast import broadcast
+    from main import build_application
+    from store import schedule_store
+
+    database.init_db()
+    app = build_application(base_url=base_url)
+    errors = []
+    async def on_error(update, context): errors.append(context.error)
+    app.add_error_handler(on_error)
+    await app.initialize()
+    await app.start()
+
+    for name in ("cold", "warm (304)"):
+        t0 = time.perf_counter()
+        ok = await tasks.update_schedule_data(None)
+        print(f"update_schedule_data {name}: {time.perf_counter() - t0:.2f} с, успех: {ok}")
+    groups = sorted(schedule_store.current.data)
+    if not groups: raise SystemExit("Из фикстур не извлечено ни одной группы")
+
+    user_ids = list(range(10_000, 10_000 + args.users))
+    for uid in user_ids: database.grant_access(uid)
+
+    sim = SimUpdates()
+    today = datetime.datetime.now(config.TZ_SARATOV).date()
+    latencies = {}
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def send(step, data):
+        async with sem:
+            t0 = time.perf_counter()
+            await app.process_update(Update.de_json(data, app.bot))
+            latencies.setdefault(step, []).append(time.perf_counter() - t0)
+
+    async def user_session(i, uid):
+        await send("/start", sim.message(uid, "/start"))
+        await send("setgroup", sim.callback(uid, f"setgroup_{groups[i % len(groups)]}"))
+        await send("Расписание", sim.message(uid, "📅 Расписание"))
+        for d in range(1, args.nav + 1):
+            await send("навигация", sim.callback(uid, f"sched_{(today + datetime.timedelta(days=d)):%Y-%m-%d}"))
+        await send("неделя", sim.callback(uid, f"week_{today:%Y-%m-%d}"))
+        await send("ics", sim.callback(uid, "ics"))
+        await send("настройки", sim.callback(uid, "toggle_20"))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user_session(i, uid) for i, uid in enumerate(user_ids)))
+    elapsed = time.perf_counter() - t0
+    total = sum(len(v) for v in latencies.values())
+    print(f"\nПользователей: {args.users}, апдейтов: {total}, {total / elapsed:.0f} апдейтов/с, ошибок: {len(errors)}")
+    print(f"{'шаг':<12} {'p50, мс':>8} {'p99, мс':>8}")
+    for step, values in latencies.items():
+        print(f"{step:<12} {percentile(values, 0.5) * 1000:>8.2f} {percentile(values, 0.99) * 1000:>8.2f}")
+
+    #notifier: построение индекса на учебный день и отправка самой большой пачки
+    monday = today + datetime.timedelta(days=(7 - today.weekday()) % 7 or 7)
+    now = config.TZ_SARATOV.localize(datetime.datetime.combine(monday, datetime.time(6, 0)))
+    users = database.get_users_for_class_notification()
+    t0 = time.perf_counter()
+    tasks.build_notify_index(now, users)
+    build_time = time.perf_counter() - t0
+    slots = tasks.notify_index["slots"]
+    print(f"\nИндекс уведомлений: {build_time * 1000:.1f} мс, минут с отправкой: {len(slots)}, сообщений: {sum(map(len, slots.values()))}")
+    if slots:
+        batch = max(slots.values(), key=len)
+        t0 = time.perf_counter()
+        result = await broadcast(app.bot, list(batch.items()))
+        tick = time.perf_counter() - t0
+        print(f"Тик notifier: {len(batch)} сообщений за {tick * 1000:.0f} мс ({result})")
+
+    print(f"\nВызовы Bot API: {api.calls}")
+    await app.stop()
+    await app.shutdown()
+    api_server.close()
+    site_server.close()
+
+def bench_load(args):
+    """Нагрузочный тест: тысячи пользователей через /start, навигацию и настройки на заглушках"""
+    asyncio.run(_load(args))
+
+# ================= POLLING ПРОТИВ WEBHOOK =================
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _transport_run(mode, args, api, base_url, user_ids):
+    """Задержка от появления апдейта до ответа бота для одного способа доставки"""
+    import httpx
+    from main import build_application
+
+    app = build_application(base_url=base_url)
+    await app.initialize()
+    await app.start()
+    client = None
+    if mode == "polling":
+        await app.updater.start_polling(poll_interval=0, timeout=2)
+        async def deliver(update): await api.updates.put(update)
+    else:
+        port, secret = free_port(), "bench-secret"
+        await app.updater.start_webhook(listen="127.0.0.1", port=port, url_path="bench",
+                                        webhook_url=f"http://127.0.0.1:{port}/bench", secret_token=secret)
+        client = httpx.AsyncClient()
+        async def deliver(update):
+            await client.post(f"http://127.0.0.1:{port}/bench", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+    sim = SimUpdates()
+    latencies = []
+    async def one(uid):
+        reply = api.wait_for_reply(uid)
+        t0 = time.perf_counter()
+        await deliver(sim.message(uid, "📅 Расписание"))
+        latencies.append(await asyncio.wait_for(reply, 10) - t0)
+
+    t0 = time.perf_counter()
+    #в каждом раунде concurrency разных пользователей пишут одновременно
+    for _ in range(args.rounds):
+        await asyncio.gather(*(one(uid) for uid in user_ids))
+    elapsed = time.perf_counter() - t0
+
+    if client: await client.aclose()
+    await app.updater.stop()
+    await app.stop()
+    await app.shutdown()
+    print(f"{mode:<8} {percentile(latencies, 0.5) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f} {len(latencies) / elapsed:>9.0f}")
+
+async def _transport(args):
+    import tempfile
+    from fakes import FakeBotAPI, serve_http
+
+    api = FakeBotAPI()
+    api_server, api_port = await serve_http(api.handle)
+    base_url = patch_config_for_fakes(api_port, 0, tempfile.mkdtemp())
+    import config
+    config.CONCURRENT_UPDATES = args.concurrent_updates
+
+    import database
+    from render import rebuild_render_cache
+    from store import schedule_store
+
+    database.init_db()
+    data = synthetic_schedule(8, seed=1)
+    rebuild_render_cache(schedule_store.publish(data, None))
+    user_ids = list(range(10_000, 10_000 + args.concurrency))
+    groups = sorted(data)
+    for i, uid in enumerate(user_ids):
+        database.grant_access(uid)
+        database.set_user_group(uid, groups[i % len(groups)])
+
+    print(f"Апдейтов на режим: {args.rounds * args.concurrency}, одновременно: {args.concurrency}, concurrent_updates: {args.concurrent_updates}")
+    print(f"{'режим':<8} {'p50, мс':>8} {'p99, мс':>8} {'апдейт/с':>9}")
+    for mode in args.modes:
+        await _transport_run(mode, args, api, base_url, user_ids)
+    api_server.close()
+
+def bench_transport(args):
+    """Задержка апдейт -> ответ: long polling против webhook на заглушке Bot API"""
+    asyncio.run(_transport(args))
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("parse", help="парсинг PDF: inline / threads / processes")
+    p.add_argument("--fixtures", required=True, help="папка с образцами PDF")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("extract", help="извлечение таблиц: страниц/с и пиковая память")
+    p.add_argument("--fixtures", required=True, help="папка с образцами PDF")
+    p.set_defaults(func=bench_extract)
+
+    p = sub.add_parser("db", help="накладные расходы базы на запрос")
+    p.add_argument("--users", type=int, default=1000)
+    p.add_argument("--requests", type=int, default=5000)
+    p.set_defaults(func=bench_db)
+
+    p = sub.add_parser("store", help="память хранимых версий расписания")
+    p.add_argument("--groups", type=int, default=200)
+    p.add_argument("--versions", type=int, default=5)
+    p.add_argument("--reads", type=int, default=1_000_000)
+    p.set_defaults(func=bench_store)
+
+    p = sub.add_parser("load", help="нагрузочный тест обработчиков, notifier и обновления на заглушках")
+    p.add_argument("--fixtures", required=True, help="папка с образцами PDF для заглушки сайта")
+    p.add_argument("--users", type=int, default=2000)
+    p.add_argument("--nav", type=int, default=5, help="нажатий навигации на пользователя")
+    p.add_argument("--concurrency", type=int, default=64)
+    p.add_argument("--executor", default="inline", choices=["inline", "threads", "processes"])
+    p.set_defaults(func=bench_load)
+
+    p = sub.add_parser("transport", help="задержка апдейт -> ответ: polling против webhook")
+    p.add_argument("--modes", nargs="+", default=["polling", "webhook"], choices=["polling", "webhook"])
+    p.add_argument("--rounds", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=16, help="пользователей, пишущих одновременно")
+    p.add_argument("--concurrent-updates", type=int, default=32)
+    p.set_defaults(func=bench_transport)
+
+    args = ap.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import time
+import asyncio
+import logging
+from telegram.constants import ParseMode
+from telegram.error import RetryAfter, Forbidden, NetworkError, TelegramError
+
+from config import BROADCAST_RATE, BROADCAST_CHAT_INTERVAL, BROADCAST_CONCURRENCY, BROADCAST_RETRIES
+from database import disable_notifications, run_db
+
+logger = logging.getLogger(__name__)
+
+# ================= РАССЫЛКИ =================
+
+class RateLimiter:
+    """Равномерно распределяет отправки: не чаще rate в секунду на весь бот"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0: await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+    def pause(self, seconds):
+        """После RetryAfter Telegram не принимает сообщения от бота целиком - ждут все"""
+        self._next = max(self._next, time.monotonic() + seconds)
+
+#общий лимит на все рассылки процесса (уведомления, изменения, /send_all)
+global_limiter = RateLimiter(BROADCAST_RATE)
+#время последней отправки в чат - для паузы между сообщениями одному пользователю
+_chat_last_sent = {}
+
+class BroadcastResult:
+    __slots__ = ("delivered", "failed", "blocked", "blocked_ids")
+
+    def __init__(self):
+        self.delivered = 0
+        self.failed = 0
+        self.blocked = 0
+        self.blocked_ids = []
+
+    def __str__(self):
+        return f"доставлено {self.delivered}, ошибок {self.failed}, заблокировали бота {self.blocked}"
+
+async def _wait_chat_slot(chat_id):
+    #слот резервируется до ожидания, чтобы параллельные отправки в один чат не совпали
+    now = time.monotonic()
+    slot = max(now, _chat_last_sent.get(chat_id, now - BROADCAST_CHAT_INTERVAL) + BROADCAST_CHAT_INTERVAL)
+    _chat_last_sent[chat_id] = slot
+    if slot > now: await asyncio.sleep(slot - now)
+
+async def _send_one(bot, chat_id, text, parse_mode, result):
+    for attempt in range(BROADCAST_RETRIES + 1):
+        await _wait_chat_slot(chat_id)
+        await global_limiter.wait()
+        try:
+            await bot.send_message(chat_id, text, parse_mode=parse_mode)
+            result.delivered += 1
+            return
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"RetryAfter {retry_after} с при отправке {chat_id}")
+            global_limiter.pause(retry_after)
+        except Forbidden:
+            result.blocked += 1
+            result.blocked_ids.append(chat_id)
+            return
+        except NetworkError as e:
+            logger.warning(f"Сетевая ошибка при отправке {chat_id}: {e}")
+            await asyncio.sleep(2 ** attempt)
+        except TelegramError as e:
+            logger.info(f"Не удалось отправить {chat_id}: {e}")
+            result.failed += 1
+            return
+    result.failed += 1
+
+async def broadcast(bot, messages, parse_mode=ParseMode.HTML):
+    """Отправляет пары (chat_id, текст) с общим и поштучным лимитом, без дублей.
+    Пользователям, заблокировавшим бота, выключаются уведомления"""
+    result = BroadcastResult()
+    queue = asyncio.Queue()
+    seen = set()
+    for chat_id, text in messages:
+        if (chat_id, text) in seen: continue
+        seen.add((chat_id, text))
+        queue.put_nowait((chat_id, text))
+
+    async def worker():
+        while not queue.empty():
+            chat_id, text = queue.get_nowait()
+            await _send_one(bot, chat_id, text, parse_mode, result)
+
+    await asyncio.gather(*(worker() for _ in range(min(BROADCAST_CONCURRENCY, queue.qsize()))))
+
+    if result.blocked_ids:
+        await run_db(disable_notifications, result.blocked_ids)
+    return result
@@ -0,0 +1,148 @@
+import re
+import sys
+from collections import namedtuple
+
+#одна пара: разобранные поля ячейки и исходный текст (text); отсутствующее поле - None.
+#пары с одинаковым текстом - один и тот же объект, сравнение - через is
+Pair = namedtuple("Pair", ["subject", "kind", "teacher", "room", "subgroup", "text"])
+
+# ================= РАЗБОР ЯЧЕЕК РАСПИСАНИЯ =================
+
+#тип занятия: в скобках ("(лек.)", "(практика)") или отдельным маркером ("пр.", "лекция") не в начале текста -
+#слова названия ("Практикум ...", "Лабораторный практикум") типом не считаются
+KIND_MARKERS = r"лекция|практика|лабораторная|семинар|лекц\.|лек\.|практ\.|пр\.|лаб\.|сем\."
+KIND_RE = re.compile(
+    rf"\(\s*({KIND_MARKERS}|лек|пр|лаб|сем)\s*\)|(?<![\w.])({KIND_MARKERS})(?!\w)", re.IGNORECASE
+)
+KIND_NAMES = (("лек", "лекция"), ("пр", "практика"), ("лаб", "лабораторная"), ("сем", "семинар"))
+SUBGROUP_RE = re.compile(r"(\d)\s*(?:п/г|подгр\w*\.?)|(?:п/г|подгр\w*\.?)\s*(\d)", re.IGNORECASE)
+ROOM_RE = re.compile(r"(?:ауд\.?|аудитория|а\.)\s*(\d[\w\-/]*|[\w\-/]*\d)", re.IGNORECASE)
+TEACHER_RE = re.compile(r"(?:(?:доц|проф|ст\.\s?преп|преп|асс)\.?\s*)?[А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?\s+[А-ЯЁ]\.\s?[А-ЯЁ]\.")
+
+def normalize_text(text):
+    if not text: return ""
+    return "".join(text.lower().split())
+
+def intern_opt(value):
+    return sys.intern(value) if value else None
+
+def find_kind(text):
+    """Первый маркер типа занятия: в скобках - где угодно, без скобок - только после первого слова"""
+    first_word = re.match(r"\s*\S*", text).end()
+    for m in KIND_RE.finditer(text):
+        if m.group(1) or m.start() >= first_word: return m
+    return None
+
+def parse_cell(text):
+    """Ячейка -> Pair. Ячейки с несколькими преподавателями или аудиториями (пары подгрупп в одной
+    клетке) не разбираются: весь текст остается в subject"""
+    text = sys.intern(text)
+    if len(TEACHER_RE.findall(text)) > 1 or len(ROOM_RE.findall(text)) > 1:
+        return Pair(text, None, None, None, None, text)
+    rest, fields = text, {}
+    for name, regex in (("teacher", TEACHER_RE), ("room", ROOM_RE), ("subgroup", SUBGROUP_RE), ("kind", KIND_RE)):
+        m = find_kind(rest) if name == "kind" else regex.search(rest)
+        if not m: continue
+        if name == "teacher": fields[name] = " ".join(m.group(0).split())
+        elif name == "subgroup": fields[name] = m.group(1) or m.group(2)
+        elif name == "kind":
+            word = (m.group(1) or m.group(2)).lower()
+            fields[name] = next((full for prefix, full in KIND_NAMES if word.startswith(prefix)), word)
+        else: fields[name] = m.group(1)
+        rest = rest[:m.start()] + " " + rest[m.end():]
+    subject = " ".join(rest.split()).strip(" ,.;:-") or text
+    return Pair(sys.intern(subject), intern_opt(fields.get("kind")), intern_opt(fields.get("teacher")),
+                intern_opt(fields.get("room")), intern_opt(fields.get("subgroup")), text)
+
+def pair_details(pair):
+    """Вторая строка пары: преподаватель, аудитория, подгруппа"""
+    parts = []
+    if pair.teacher: parts.append(f"👤 {pair.teacher}")
+    if pair.room: parts.append(f"🚪 {pair.room}")
+    if pair.subgroup: parts.append(f"👥 {pair.subgroup} п/г")
+    return " · ".join(parts)
+
+def pair_title(pair):
+    return f"{pair.subject} ({pair.kind})" if pair.kind else pair.subject
+
+def pair_summary(pair):
+    """Одной строкой - для уведомлений и списков изменений"""
+    summary = pair_title(pair)
+    if pair.room: summary += f", ауд. {pair.room}"
+    if pair.subgroup: summary += f", {pair.subgroup} п/г"
+    return summary
+
+# ================= КОМПАКТНОЕ ХРАНЕНИЕ ДНЯ =================
+
+class Day:
+    """Пары дня в кортеже: slots[i] - пара номер i + 1 (Pair) или None.
+    Интерфейс словаря {номер пары: Pair} только для чтения"""
+    __slots__ = ("slots",)
+
+    def __init__(self, slots):
+        self.slots = slots
+
+    def get(self, pair_num, default=None):
+        if 0 < pair_num <= len(self.slots):
+            cell = self.slots[pair_num - 1]
+            if cell is not None: return cell
+        return default
+
+    def __getitem__(self, pair_num):
+        cell = self.get(pair_num)
+        if cell is None: raise KeyError(pair_num)
+        return cell
+
+    def __contains__(self, pair_num):
+        return self.get(pair_num) is not None
+
+    def keys(self):
+        return [i + 1 for i, cell in enumerate(self.slots) if cell is not None]
+
+    def items(self):
+        return [(i + 1, cell) for i, cell in enumerate(self.slots) if cell is not None]
+
+    def values(self):
+        return [cell for cell in self.slots if cell is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.slots) - self.slots.count(None)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __repr__(self):
+        return f"Day({dict(self.items())!r})"
+
+EMPTY_DAY = Day(())
+
+def same_cell(a, b):
+    """Ячейки отличаются только регистром или пробелами - для уведомлений это не изменение"""
+    return a is b or (a is not None and b is not None and normalize_text(a.text) == normalize_text(b.text))
+
+class CellPool:
+    """Разобранные ячейки: каждый различный текст разбирается один раз, равные тексты дают один и тот же Pair.
+    Пул - по точному тексту: исправление регистра или пробелов должно дойти до пользователей"""
+
+    def __init__(self):
+        self._by_text = {}
+
+    def pair(self, text):
+        cell = self._by_text.get(text)
+        if cell is None: cell = self._by_text[text] = parse_cell(text)
+        return cell
+
+    def day(self, pairs):
+        """{номер пары: текст} -> кортеж слотов для Day"""
+        pairs = {p: self.pair(t) for p, t in pairs.items() if t and p > 0}
+        if not pairs: return ()
+        slots = [None] * max(pairs)
+        for p, cell in pairs.items(): slots[p - 1] = cell
+        return tuple(slots)
+
+    def retain(self, live):
+        """Оставляет только ячейки из множества live (id объектов Pair)"""
+        self._by_text = {t: c for t, c in self._by_text.items() if id(c) in live}
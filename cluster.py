@@ -0,0 +1,60 @@
+import os
+import fcntl
+
+from config import NOTIFIER_LOCK_FILE, REFRESH_TRIGGER_FILE
+
+# ================= СОГЛАСОВАНИЕ ПРОЦЕССОВ (REFRESHER И FRONT-END'Ы) =================
+
+class FileLock:
+    """Неблокирующая межпроцессная блокировка на файле (flock). ОС снимает ее, когда процесс завершается,
+    поэтому после падения держателя блокировку подхватывает следующий процесс"""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def try_acquire(self):
+        if self._fd is not None: return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        #pid держателя - для диагностики
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None: return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+notifier_lock = FileLock(NOTIFIER_LOCK_FILE)
+
+def file_stamp(path):
+    """Отпечаток файла: меняется при каждой атомарной замене (os.replace) или None, если файла нет"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_ino, st.st_size
+
+def request_refresh():
+    """Просит refresher.py обновить расписание вне очереди"""
+    with open(REFRESH_TRIGGER_FILE, "w"): pass
+
+def take_refresh_request():
+    """True, если обновление запрошено (запрос при этом снимается)"""
+    try:
+        os.remove(REFRESH_TRIGGER_FILE)
+        return True
+    except FileNotFoundError:
+        return False
@@ -10,15 +10,52 @@ BOT_TOKEN = ""
 # ID админа (для доступа к командам управления пользователями)
 ADMIN_ID = 123456789
 
+#способ получения апдейтов: "polling" (getUpdates) или "webhook" (Telegram сам присылает апдейты)
+BOT_MODE = "polling"
+#webhook: бот слушает HTTP на WEBHOOK_LISTEN:WEBHOOK_PORT, TLS снимает обратный прокси (nginx и т.п.),
+#который проксирует WEBHOOK_URL на локальный адрес. WEBHOOK_URL - публичный https-адрес с путем WEBHOOK_PATH
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8080
+WEBHOOK_PATH = "telegram"
+WEBHOOK_URL = ""
+#секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token (чужие запросы отбрасываются)
+WEBHOOK_SECRET = ""
+#сколько одновременных соединений Telegram открывает к webhook
+WEBHOOK_MAX_CONNECTIONS = 40
+#сколько апдейтов обрабатывается одновременно (медленный обработчик не задерживает остальных)
+CONCURRENT_UPDATES = 32
+
 #ссылка на страницу с расписанием
 SCHEDULE_URL = "https://www.vavilovsar.ru/upravlenie-obespecheniya-kachestva-obrazovaniya/struktura/otdel-organizacii-uchebnogo-processa/uk2/institut-injenerii-i-robototexniki/ochnaya-forma-obucheniya"
-#фильтр для поиска PDF 
-SEARCH_QUERY_PDF = "б-пи-101" 
-#кол-во потоков для парсинга PDF
+#страницы, с которых начинается поиск PDF (другие институты и формы обучения - добавить их страницы
+#или общую страницу раздела с CRAWL_MAX_DEPTH >= 1)
+SCHEDULE_SEED_URLS = [SCHEDULE_URL]
+#обход переходит только на страницы, адрес которых начинается с одного из префиксов
+CRAWL_SCOPE = ["https://www.vavilovsar.ru/upravlenie-obespecheniya-kachestva-obrazovaniya/struktura/otdel-organizacii-uchebnogo-processa/uk2/"]
+#глубина обхода от стартовых страниц (0 - только сами стартовые страницы), предел страниц за обход
+#и сколько страниц загружается одновременно
+CRAWL_MAX_DEPTH = 0
+CRAWL_MAX_PAGES = 200
+CRAWL_CONCURRENCY = 4
+#фильтр для поиска PDF ("" - все PDF на странице; группы определяются по шапкам таблиц)
+SEARCH_QUERY_PDF = "" 
+#кол-во воркеров для парсинга PDF
 MAX_WORKERS = 8
+#режим исполнителя парсинга: "processes" (обход GIL), "threads" или "inline" (в event loop, для отладки)
+PARSE_EXECUTOR = "processes"
+#сколько страниц PDF разбирает одна задача (большие PDF делятся на части)
+PAGES_PER_CHUNK = 4
+#сколько разобранных страниц (по хешу содержимого) помнит каждый воркер парсинга
+PAGE_CACHE_SIZE = 256
+#бюджет памяти на одновременно парсящиеся PDF (байт); оценка одного PDF - размер файла * PDF_MEMORY_FACTOR
+#(объекты pdfplumber занимают в разы больше самого файла). PDF больше бюджета парсится в одиночку
+PDF_MEMORY_BUDGET = 256 * 2**20
+PDF_MEMORY_FACTOR = 20
 
 #дата начала семестра (нужна для определения четности недели)
 SEMESTER_START_DATE = datetime.date(2026, 1, 26) 
+#последний день семестра (календарь учебных дней строится на весь семестр)
+SEMESTER_END_DATE = datetime.date(2026, 7, 5)
 #временная зона для всех операций с датой/временем
 TZ_SARATOV = pytz.timezone('Europe/Saratov')
 
@@ -26,6 +63,25 @@ TZ_SARATOV = pytz.timezone('Europe/Saratov')
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 #база данных будет храниться в файле рядом со скриптами
 DB_FILE = os.path.join(BASE_DIR, "bot_users.db")
+#снимок последнего распарсенного расписания (загружается при старте до первого обновления)
+SNAPSHOT_FILE = os.path.join(BASE_DIR, "schedule_snapshot.json.gz")
+#праздники и переносы учебных дней (JSON, см. semester.load_overrides); файла может не быть
+CALENDAR_OVERRIDES_FILE = os.path.join(BASE_DIR, "calendar_overrides.json")
+
+#роль процесса main.py: "standalone" - сам обновляет расписание; "frontend" - только отвечает пользователям,
+#а расписание публикует в SNAPSHOT_FILE отдельный процесс refresher.py (front-end'ов может быть несколько,
+#тогда нужен BOT_MODE = "webhook" и балансировщик перед ними, порт задается через main.py --webhook-port)
+BOT_ROLE = "standalone"
+#как часто front-end проверяет новый снимок и изменения базы из других процессов (сек)
+SNAPSHOT_POLL_INTERVAL = 5
+#notifier и уведомления об изменениях шлет только front-end, удерживающий эту блокировку
+NOTIFIER_LOCK_FILE = os.path.join(BASE_DIR, "notifier.lock")
+#как часто (сек) notifier страхуется: перезаводит пропущенный или упавший запуск и индекс на новые сутки
+NOTIFIER_REARM_INTERVAL = 600
+#второй refresher.py не запустится, пока жив первый
+REFRESHER_LOCK_FILE = os.path.join(BASE_DIR, "refresher.lock")
+#запрос внеочередного обновления для refresher.py (кнопка "Обновить" в front-end)
+REFRESH_TRIGGER_FILE = os.path.join(BASE_DIR, "refresh.trigger")
 
 #временные рамки для классов (для определения текущей пары)
 CLASS_TIMES = {
@@ -47,6 +103,39 @@ TIME_START_TO_PAIR_NUM = {
 HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
+#таймауты HTTP-клиента парсера (сек): соединение, страница со ссылками, скачивание PDF
+HTTP_CONNECT_TIMEOUT = 10
+PAGE_TIMEOUT = 15
+PDF_TIMEOUT = 30
+#пул соединений: всего и одновременно к одному хосту
+HTTP_MAX_CONNECTIONS = 16
+HTTP_PER_HOST_LIMIT = 4
+#повторы при сетевых ошибках и 5xx/429 с экспоненциальной задержкой (HTTP_BACKOFF * 2^попытка)
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 1.0
+
+#рассылки: общий лимит сообщений в секунду (у Telegram ~30), пауза между сообщениями в один чат,
+#число параллельных отправок и повторов после RetryAfter/сетевых ошибок
+BROADCAST_RATE = 25
+BROADCAST_CHAT_INTERVAL = 1.0
+BROADCAST_CONCURRENCY = 8
+BROADCAST_RETRIES = 3
+
+#метрики (тайминги и счетчики) для /stats; эндпоинт Prometheus поднимается, если задан порт
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None
+
+#адаптивное обновление расписания (сек): минимальный интервал в "горячее" время (учебные часы,
+#вечер воскресенья перед новой неделей, начало семестра); без изменений интервал удваивается
+#до потолка (днем и ночью свой); после ошибки - быстрый повтор с удвоением
+REFRESH_MIN_INTERVAL = 15 * 60
+REFRESH_HOT_MAX_INTERVAL = 2 * 3600
+REFRESH_MAX_INTERVAL = 6 * 3600
+REFRESH_RETRY_INTERVAL = 2 * 60
+#учебные часы (с, по) и сколько дней до/после начала семестра опрашивать часто
+REFRESH_HOT_HOURS = (7, 20)
+REFRESH_SEMESTER_HOT_DAYS = 7
 
-#кеш для расписания (хранит последние данные и время обновления)
-schedule_cache = {"last_update": None, "data": {}}
+#сколько последних версий расписания держать в памяти для отката и сравнения
+SCHEDULE_HISTORY_SIZE = 5
@@ -0,0 +1,124 @@
+import json
+import asyncio
+import datetime
+import logging
+from html.parser import HTMLParser
+from urllib.parse import unquote, urljoin, urldefrag, urlsplit
+
+from config import (
+    SCHEDULE_SEED_URLS, CRAWL_SCOPE, CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, CRAWL_CONCURRENCY,
+    SEARCH_QUERY_PDF, TZ_SARATOV
+)
+from database import get_fetch_entry, save_fetch_entry, mark_links_seen, run_db
+from http_client import http_client, conditional_headers
+
+logger = logging.getLogger(__name__)
+
+#расширения файлов, по которым обход не переходит (не HTML-страницы)
+SKIP_EXTENSIONS = (".doc", ".docx", ".xls", ".xlsx", ".jpg", ".jpeg", ".png", ".gif", ".zip", ".rar", ".mp4")
+
+# ================= ОБХОД САЙТА: ПОИСК PDF С РАСПИСАНИЕМ =================
+
+class LinkExtractor(HTMLParser):
+    """Собирает href из <a> и <base> по мере поступления HTML; дерево документа не строится"""
+
+    def __init__(self, page_url):
+        super().__init__(convert_charrefs=True)
+        self.base = page_url
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a" and tag != "base": return
+        href = next((value for name, value in attrs if name == "href" and value), None)
+        if not href: return
+        if tag == "base": self.base = urljoin(self.base, href.strip())
+        else: self.hrefs.append(href.strip())
+
+def url_key(url):
+    """Ключ для дедупликации: без фрагмента, после unquote, регистр схемы и хоста не важен"""
+    parts = urlsplit(url)
+    path = unquote(parts.path).rstrip("/") or "/"
+    return f"{parts.scheme.lower()}://{parts.netloc.lower()}{path}?{unquote(parts.query)}"
+
+def in_scope(url, scope):
+    decoded = unquote(url).lower()
+    return any(decoded.startswith(unquote(prefix).lower()) for prefix in scope)
+
+def classify_links(base, hrefs, query):
+    """Абсолютные ссылки страницы без повторов: (PDF, подходящие под SEARCH_QUERY_PDF; остальные HTML-страницы)"""
+    pdfs, pages, seen = [], [], set()
+    for href in hrefs:
+        url = urldefrag(urljoin(base, href))[0]
+        if urlsplit(url).scheme not in ("http", "https"): continue
+        key = url_key(url)
+        if key in seen: continue
+        seen.add(key)
+        decoded = unquote(url).lower().replace(" ", "")
+        if ".pdf" in decoded:
+            if query in decoded: pdfs.append(url)
+        elif not urlsplit(decoded).path.endswith(SKIP_EXTENSIONS):
+            pages.append(url)
+    return pdfs, pages
+
+async def scan_page(url):
+    """Ссылки страницы (pdfs, pages). Условный запрос: при 304 ссылки берутся из кеша загрузок"""
+    entry = await run_db(get_fetch_entry, url)
+    cached = json.loads(entry[3]) if entry and entry[3] else None
+    #в кеше старого формата (список PDF) нет ссылок на страницы - такую страницу качаем заново
+    headers = conditional_headers(entry) if isinstance(cached, dict) else None
+    extractor = LinkExtractor(url)
+    response = await http_client.scan_text(url, extractor.feed, headers=headers)
+    if response.status == 304:
+        return cached["pdfs"], cached["pages"]
+    extractor.close()
+    pdfs, pages = classify_links(extractor.base, extractor.hrefs, SEARCH_QUERY_PDF.lower().replace(" ", ""))
+    await run_db(
+        save_fetch_entry, url, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+        response.sha256, json.dumps({"pdfs": pdfs, "pages": pages}, ensure_ascii=False)
+    )
+    return pdfs, pages
+
+async def crawl(seeds, scope, max_depth, max_pages, concurrency):
+    """Обход в ширину от стартовых страниц с ограниченным числом одновременных загрузок.
+    Возвращает (ссылки на PDF без повторов, обойденные страницы)"""
+    frontier = asyncio.Queue()
+    seen_pages, pages, pdfs = set(), [], {}
+
+    def enqueue(url, depth):
+        key = url_key(url)
+        if key in seen_pages or len(seen_pages) >= max_pages: return
+        seen_pages.add(key)
+        frontier.put_nowait((url, depth))
+
+    async def worker():
+        while True:
+            url, depth = await frontier.get()
+            try:
+                page_pdfs, page_links = await scan_page(url)
+                pages.append(url)
+                for link in page_pdfs: pdfs.setdefault(url_key(link), link)
+                if depth < max_depth:
+                    for link in page_links:
+                        if in_scope(link, scope): enqueue(link, depth + 1)
+            except Exception as e:
+                logger.error(f"Обход {url}: {e}")
+            finally:
+                frontier.task_done()
+
+    for seed in seeds: enqueue(seed, 0)
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        await frontier.join()
+    finally:
+        for w in workers: w.cancel()
+    return list(pdfs.values()), pages
+
+async def find_all_pdf_links():
+    """Находит ВСЕ ссылки на PDF со стартовых страниц и страниц в пределах CRAWL_SCOPE"""
+    links, pages = await crawl(SCHEDULE_SEED_URLS, CRAWL_SCOPE, CRAWL_MAX_DEPTH, CRAWL_MAX_PAGES, CRAWL_CONCURRENCY)
+    logger.info(f"Обход сайта: страниц {len(pages)}, PDF {len(links)}")
+    try:
+        await run_db(mark_links_seen, links + pages, datetime.datetime.now(TZ_SARATOV).isoformat(timespec="seconds"))
+    except Exception as e:
+        logger.error(f"Не удалось отметить найденные ссылки: {e}")
+    return links
@@ -1,10 +1,97 @@
+import asyncio
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from config import DB_FILE, ADMIN_ID
+from metrics import timer, inc
 
 # ================= БАЗА ДАННЫХ =================
 
+#одно долгоживущее соединение на процесс (WAL, кеш подготовленных запросов)
+_conn = None
+_lock = threading.RLock()
+#async-код ходит в базу через один выделенный поток, не блокируя event loop
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db")
+
+def get_conn():
+    global _conn
+    with _lock:
+        if _conn is None:
+            conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=5000')
+            _conn = conn
+        return _conn
+
+def close_db():
+    global _conn
+    with _lock:
+        if _conn is not None:
+            _conn.close()
+            _conn = None
+
+async def run_db(func, *args):
+    """Выполняет функцию доступа к базе в потоке базы"""
+    return await asyncio.get_running_loop().run_in_executor(_db_executor, func, *args)
+
+# ================= ПРОФИЛИ ПОЛЬЗОВАТЕЛЕЙ (КЕШ В ПАМЯТИ) =================
+
+PROFILE_COLUMNS = ('user_id', 'is_allowed', 'group_name', 'notify_20', 'notify_10', 'notify_5', 'notify_changes', 'use_new_style')
+
+class UserProfile:
+    """Строка users целиком; читается из базы один раз, далее обновляется при записи"""
+    __slots__ = PROFILE_COLUMNS
+
+    def __init__(self, user_id, is_allowed, group_name, notify_20, notify_10, notify_5, notify_changes, use_new_style):
+        self.user_id = user_id
+        self.is_allowed = bool(is_allowed)
+        self.group_name = group_name
+        self.notify_20 = bool(notify_20)
+        self.notify_10 = bool(notify_10)
+        self.notify_5 = bool(notify_5)
+        self.notify_changes = bool(notify_changes)
+        self.use_new_style = bool(use_new_style)
+
+#user_id -> UserProfile, либо None, если пользователя нет в базе
+_profiles = {}
+
+def _reload_profile(user_id):
+    row = get_conn().execute(f'SELECT {", ".join(PROFILE_COLUMNS)} FROM users WHERE user_id = ?', (user_id,)).fetchone()
+    _profiles[user_id] = UserProfile(*row) if row else None
+    return _profiles[user_id]
+
+def get_profile(user_id):
+    with _lock:
+        if user_id in _profiles: return _profiles[user_id]
+        return _reload_profile(user_id)
+
+async def load_profile(user_id):
+    """Профиль для обработчиков: из памяти без обращения к базе, при промахе - через поток базы"""
+    if user_id in _profiles:
+        inc("db.profile_hit")
+        return _profiles[user_id]
+    with timer("db.profile_load"):
+        return await run_db(get_profile, user_id)
+
+#PRAGMA data_version: меняется, когда базу изменило другое соединение (другой процесс бота)
+_data_version = None
+
+def sync_profiles():
+    """Сбрасывает кеш профилей, если базу изменил другой процесс. Возвращает True при изменении"""
+    global _data_version
+    with _lock:
+        version = get_conn().execute('PRAGMA data_version').fetchone()[0]
+        changed = _data_version is not None and version != _data_version
+        _data_version = version
+        if changed: _profiles.clear()
+        return changed
+
+def has_access(user_id, profile):
+    return user_id == ADMIN_ID or bool(profile and profile.is_allowed)
+
 def init_db():
-    with sqlite3.connect(DB_FILE) as conn:
+    with _lock, get_conn() as conn:
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -24,83 +111,177 @@ def init_db():
         except sqlite3.OperationalError: pass
         try: cursor.execute("ALTER TABLE users ADD COLUMN use_new_style BOOLEAN DEFAULT 0")
         except sqlite3.OperationalError: pass
-        
+
+        #кеш загрузок: валидаторы HTTP и хеш содержимого для условных запросов
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                sha256 TEXT,
+                payload TEXT
+            )
+        ''')
+        #метаданные ссылок, найденных обходом сайта: размер тела и когда ссылка встречалась последний раз
+        try: cursor.execute("ALTER TABLE fetch_cache ADD COLUMN size INTEGER")
+        except sqlite3.OperationalError: pass
+        try: cursor.execute("ALTER TABLE fetch_cache ADD COLUMN last_seen TEXT")
+        except sqlite3.OperationalError: pass
+        #версия парсера, которой получен payload PDF (NULL - до появления версий или не PDF)
+        try: cursor.execute("ALTER TABLE fetch_cache ADD COLUMN parser_version INTEGER")
+        except sqlite3.OperationalError: pass
+
+        #фильтр /users и выборки уведомлений по группе
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_group ON users (group_name)')
+
         cursor.execute('INSERT OR IGNORE INTO users (user_id, is_allowed) VALUES (?, 1)', (ADMIN_ID,))
         cursor.execute('UPDATE users SET is_allowed = 1 WHERE user_id = ?', (ADMIN_ID,))
-        conn.commit()
 
 def check_access(user_id):
-    if user_id == ADMIN_ID: return True
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT is_allowed FROM users WHERE user_id = ?', (user_id,))
-        res = cursor.fetchone()
-        return res[0] if res else False
+    return has_access(user_id, get_profile(user_id))
 
 def grant_access(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
+    with _lock, get_conn() as conn:
+        conn.execute('''
             INSERT INTO users (user_id, is_allowed) VALUES (?, 1)
             ON CONFLICT(user_id) DO UPDATE SET is_allowed = 1
         ''', (user_id,))
-        conn.commit()
+        _reload_profile(user_id)
 
-def revoke_access_delete_user(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
-        conn.commit()
-        return cursor.rowcount > 0
+def grant_access_many(user_ids):
+    """Открывает доступ сразу многим пользователям одной транзакцией"""
+    with _lock, get_conn() as conn:
+        conn.executemany('''
+            INSERT INTO users (user_id, is_allowed) VALUES (?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET is_allowed = 1
+        ''', [(uid,) for uid in user_ids])
+        #профили перечитаются из базы при следующем обращении
+        for uid in user_ids: _profiles.pop(uid, None)
 
-def get_all_users_info():
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, is_allowed, group_name, notify_20, notify_10, notify_5, notify_changes, use_new_style FROM users')
-        return cursor.fetchall()
+def revoke_access_many(user_ids):
+    """Удаляет многих пользователей одной транзакцией. Возвращает число удаленных"""
+    with _lock, get_conn() as conn:
+        before = conn.total_changes
+        conn.executemany('DELETE FROM users WHERE user_id = ?', [(uid,) for uid in user_ids])
+        for uid in user_ids: _profiles[uid] = None
+        return conn.total_changes - before
+
+#фильтры /users по уведомлениям о парах
+USERS_NOTIFY_FILTERS = {
+    "on": '(notify_20 OR notify_10 OR notify_5)',
+    "off": 'NOT (notify_20 OR notify_10 OR notify_5)',
+}
+
+def get_users_page(cursor=None, forward=True, limit=30, group=None, notify=None):
+    """Страница пользователей по ключу user_id (без OFFSET): строки после cursor (forward) или перед ним.
+    Фильтры: group - группа, notify - ключ USERS_NOTIFY_FILTERS.
+    Возвращает (строки по возрастанию user_id, есть ли предыдущая страница, есть ли следующая, всего по фильтру)"""
+    where, params = [], []
+    if group:
+        where.append('group_name = ?')
+        params.append(group)
+    if notify in USERS_NOTIFY_FILTERS: where.append(USERS_NOTIFY_FILTERS[notify])
+
+    def cond(*extra):
+        return " AND ".join(where + list(extra)) or "1"
+
+    with _lock:
+        conn = get_conn()
+        total = conn.execute(f'SELECT COUNT(*) FROM users WHERE {cond()}', params).fetchone()[0]
+        if cursor is None: page_cond, page_params = cond(), params
+        else: page_cond, page_params = cond('user_id > ?' if forward else 'user_id < ?'), params + [cursor]
+        rows = conn.execute(f'''
+            SELECT {", ".join(PROFILE_COLUMNS)} FROM users WHERE {page_cond}
+            ORDER BY user_id {"ASC" if forward else "DESC"} LIMIT ?
+        ''', page_params + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if not forward: rows.reverse()
+        if not rows: return rows, False, False, total
+
+        def exists(extra, uid):
+            return conn.execute(f'SELECT 1 FROM users WHERE {cond(extra)} LIMIT 1', params + [uid]).fetchone() is not None
+
+        if forward: return rows, exists('user_id < ?', rows[0][0]), more, total
+        return rows, more, exists('user_id > ?', rows[-1][0]), total
 
 def get_allowed_users_ids():
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users WHERE is_allowed = 1')
-        return [row[0] for row in cursor.fetchall()]
+    with _lock:
+        return [row[0] for row in get_conn().execute('SELECT user_id FROM users WHERE is_allowed = 1')]
 
 def set_user_group(user_id, group_name):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET group_name = ? WHERE user_id = ?', (group_name, user_id))
-        conn.commit()
+    with _lock, get_conn() as conn:
+        conn.execute('UPDATE users SET group_name = ? WHERE user_id = ?', (group_name, user_id))
+        profile = _profiles.get(user_id)
+        if profile: profile.group_name = group_name
 
 def get_user_group(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT group_name FROM users WHERE user_id = ?', (user_id,))
-        res = cursor.fetchone()
-        return res[0] if res else None
+    profile = get_profile(user_id)
+    return profile.group_name if profile else None
 
 def get_user_settings(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT notify_20, notify_10, notify_5, notify_changes, use_new_style FROM users WHERE user_id = ?', (user_id,))
-        return cursor.fetchone()
+    p = get_profile(user_id)
+    return (p.notify_20, p.notify_10, p.notify_5, p.notify_changes, p.use_new_style) if p else None
 
 def toggle_setting(user_id, setting_name):
     valid = ['notify_20', 'notify_10', 'notify_5', 'notify_changes', 'use_new_style']
     if setting_name not in valid: return
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute(f'UPDATE users SET {setting_name} = 1 - {setting_name} WHERE user_id = ?', (user_id,))
-        conn.commit()
+    with _lock, get_conn() as conn:
+        conn.execute(f'UPDATE users SET {setting_name} = 1 - {setting_name} WHERE user_id = ?', (user_id,))
+        profile = _profiles.get(user_id)
+        if profile: setattr(profile, setting_name, not getattr(profile, setting_name))
 
 def get_user_style(user_id):
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT use_new_style FROM users WHERE user_id = ?', (user_id,))
-        res = cursor.fetchone()
-        return bool(res[0]) if res else False
+    profile = get_profile(user_id)
+    return profile.use_new_style if profile else False
 
 def get_users_for_change_notification():
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users WHERE is_allowed = 1 AND notify_changes = 1')
-        return [row[0] for row in cursor.fetchall()]
+    with _lock:
+        return get_conn().execute('SELECT user_id, group_name FROM users WHERE is_allowed = 1 AND notify_changes = 1').fetchall()
+
+def get_users_for_class_notification(user_ids=None):
+    """Все пользователи с доступом или только из user_ids (для точечного обновления индекса уведомлений)"""
+    query = 'SELECT user_id, group_name, notify_20, notify_10, notify_5 FROM users WHERE is_allowed = 1'
+    if user_ids is None:
+        with _lock:
+            return get_conn().execute(query).fetchall()
+    placeholders = ",".join("?" * len(user_ids))
+    with _lock:
+        return get_conn().execute(f'{query} AND user_id IN ({placeholders})', list(user_ids)).fetchall()
+
+def disable_notifications(user_ids):
+    """Выключает все уведомления пользователям, заблокировавшим бота"""
+    with _lock, get_conn() as conn:
+        conn.executemany('''
+            UPDATE users SET notify_20 = 0, notify_10 = 0, notify_5 = 0, notify_changes = 0 WHERE user_id = ?
+        ''', [(uid,) for uid in user_ids])
+        for uid in user_ids:
+            profile = _profiles.get(uid)
+            if profile: profile.notify_20 = profile.notify_10 = profile.notify_5 = profile.notify_changes = False
+
+def get_fetch_entry(url):
+    with _lock:
+        return get_conn().execute('SELECT etag, last_modified, sha256, payload, parser_version FROM fetch_cache WHERE url = ?', (url,)).fetchone()
+
+def save_fetch_entry(url, etag, last_modified, sha256, payload, size=None, parser_version=None):
+    with _lock, get_conn() as conn:
+        conn.execute('''
+            INSERT INTO fetch_cache (url, etag, last_modified, sha256, payload, size, parser_version) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag, last_modified = excluded.last_modified,
+                sha256 = excluded.sha256, payload = excluded.payload, size = COALESCE(excluded.size, size),
+                parser_version = excluded.parser_version
+        ''', (url, etag, last_modified, sha256, payload, size, parser_version))
+
+def mark_links_seen(urls, seen_at):
+    """Отмечает, когда ссылка последний раз встречалась при обходе сайта"""
+    with _lock, get_conn() as conn:
+        conn.executemany('''
+            INSERT INTO fetch_cache (url, last_seen) VALUES (?, ?)
+            ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen
+        ''', [(url, seen_at) for url in urls])
+
+def get_fetch_hashes(urls):
+    placeholders = ",".join("?" * len(urls))
+    with _lock:
+        return dict(get_conn().execute(f'SELECT url, sha256 FROM fetch_cache WHERE url IN ({placeholders})', list(urls)))
@@ -0,0 +1,51 @@
+from collections import namedtuple
+
+from config import CLASS_TIMES
+from render import DAY_NAMES_RU
+from cells import EMPTY_DAY, pair_summary, same_cell
+
+#одно изменение пары: kind - "added" / "removed" / "modified"
+Change = namedtuple("Change", ["week", "day", "pair", "kind", "old", "new"])
+
+#сколько изменений максимум перечислять в одном сообщении (лимит Telegram 4096 символов)
+MAX_CHANGES_IN_MESSAGE = 25
+
+# ================= СРАВНЕНИЕ РАСПИСАНИЙ =================
+
+def diff_schedules(old_data, new_data):
+    """Изменения по группам: {группа: [Change, ...]}. Пустой словарь - расписание не менялось.
+    Версии из одного хранилища сравниваются по ссылкам: неизменный день - тот же Day, неизменная пара - тот же Pair;
+    правка только регистра или пробелов изменением не считается"""
+    old_data, new_data = old_data or {}, new_data or {}
+    changes = {}
+    for g in sorted(set(old_data) | set(new_data)):
+        old_g, new_g = old_data.get(g, {}), new_data.get(g, {})
+        group_changes = []
+        for w in (0, 1):
+            old_w, new_w = old_g.get(w, {}), new_g.get(w, {})
+            for d in sorted(set(old_w) | set(new_w)):
+                old_d, new_d = old_w.get(d, EMPTY_DAY), new_w.get(d, EMPTY_DAY)
+                if old_d is new_d: continue
+                for p in sorted(set(old_d) | set(new_d)):
+                    old_cell, new_cell = old_d.get(p), new_d.get(p)
+                    if same_cell(old_cell, new_cell): continue
+                    if old_cell is None: kind = "added"
+                    elif new_cell is None: kind = "removed"
+                    else: kind = "modified"
+                    group_changes.append(Change(w, d, p, kind, old_cell, new_cell))
+        if group_changes: changes[g] = group_changes
+    return changes
+
+def format_changes(grp, group_changes):
+    lines = [f"⚠️ <b>Внимание! Расписание изменилось.</b>\n🎓 {grp}"]
+    for c in group_changes[:MAX_CHANGES_IN_MESSAGE]:
+        w_type = "Нижняя" if c.week == 1 else "Верхняя"
+        times = CLASS_TIMES.get(c.pair)
+        t_str = f"{times['start'][0]:02}:{times['start'][1]:02}" if times else "??"
+        head = f"\n<b>{DAY_NAMES_RU[c.day]}</b> ({w_type}), {c.pair} пара ({t_str})"
+        if c.kind == "added": lines.append(f"{head}\n➕ {pair_summary(c.new)}")
+        elif c.kind == "removed": lines.append(f"{head}\n➖ {pair_summary(c.old)}")
+        else: lines.append(f"{head}\n✏️ {pair_summary(c.old)}\n➡️ {pair_summary(c.new)}")
+    rest = len(group_changes) - MAX_CHANGES_IN_MESSAGE
+    if rest > 0: lines.append(f"\n...и еще изменений: {rest}")
+    return "\n".join(lines)
@@ -0,0 +1,150 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import PARSE_EXECUTOR, MAX_WORKERS, PAGES_PER_CHUNK, PDF_MEMORY_BUDGET, PDF_MEMORY_FACTOR
+from parser import (
+    fetch_pdf, store_parsed_pdf, parse_pdf_pages, process_table,
+    empty_groups_data, merge_groups_data
+)
+from database import run_db
+from metrics import timer, inc, reset_peak_rss, peak_rss_mb as process_peak_rss_mb
+
+logger = logging.getLogger(__name__)
+
+#долгоживущий исполнитель, переиспользуется между ежечасными обновлениями
+_executor = None
+#самая тяжелая задача парсинга за текущее обновление (МиБ): воркеры пула живут долго, RUSAGE_CHILDREN их не видит
+refresh_peak = {"workers": 0.0}
+
+# ================= ДВИЖОК ПАРСИНГА PDF =================
+
+def make_executor(mode, workers):
+    if mode == "processes": return ProcessPoolExecutor(max_workers=workers)
+    if mode == "threads": return ThreadPoolExecutor(max_workers=workers)
+    if mode == "inline": return None
+    raise ValueError(f"Неизвестный режим исполнителя: {mode}")
+
+def get_executor():
+    global _executor
+    if _executor is None and PARSE_EXECUTOR != "inline":
+        _executor = make_executor(PARSE_EXECUTOR, MAX_WORKERS)
+    return _executor
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def replace_broken_executor(broken):
+    """Пул, в котором погиб воркер (например, убит за память), больше не принимает задачи - заменяем новым.
+    Если пул уже заменила параллельная задача, ничего не делаем"""
+    global _executor
+    if _executor is not broken: return
+    logger.error("Пул воркеров сломан (воркер завершился аварийно), создаю новый")
+    inc("executor.broken")
+    broken.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+async def run_in(executor, func, *args):
+    if executor is None: return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+class MemoryBudget:
+    """Ограничивает суммарную оценку памяти PDF, которые парсятся одновременно"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self, amount):
+        amount = min(amount, self.limit)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.used + amount <= self.limit)
+            self.used += amount
+        return amount
+
+    async def release(self, amount):
+        async with self._cond:
+            self.used -= amount
+            self._cond.notify_all()
+
+memory_budget = MemoryBudget(PDF_MEMORY_BUDGET)
+
+def peak_rss_mb():
+    """Пиковый RSS за текущее обновление: процесса бота и самой тяжелой задачи парсинга (МиБ)"""
+    return process_peak_rss_mb(), refresh_peak["workers"]
+
+def note_task_peak(peak):
+    refresh_peak["workers"] = max(refresh_peak["workers"], peak)
+
+async def parse_pdf_content(path, executor):
+    """Парсит PDF: первая задача берет первые PAGES_PER_CHUNK страниц и узнает их общее число,
+    остальные страницы раздаются исполнителю параллельно по PAGES_PER_CHUNK штук.
+    Шапки разрешаются по порядку страниц: строки части до ее первой шапки относятся к последней шапке предыдущих частей"""
+    groups_data, page_count, columns, _, peak = await run_in(executor, parse_pdf_pages, path, 0, PAGES_PER_CHUNK)
+    note_task_peak(peak)
+    rest = [
+        run_in(executor, parse_pdf_pages, path, start, start + PAGES_PER_CHUNK)
+        for start in range(PAGES_PER_CHUNK, page_count, PAGES_PER_CHUNK)
+    ]
+    for part, _, part_columns, orphans, peak in await asyncio.gather(*rest):
+        note_task_peak(peak)
+        for rows in orphans: process_table(rows, groups_data, columns)
+        merge_groups_data(groups_data, part)
+        if part_columns: columns = part_columns
+    return groups_data
+
+async def process_pdf(link):
+    """Скачать (с условным запросом) и распарсить один PDF. None при ошибке"""
+    path = None
+    try:
+        with timer("refresh.download"):
+            cached, path, validators = await fetch_pdf(link)
+        if cached is not None:
+            inc("pdf.unchanged")
+            return cached
+        reserved = await memory_budget.acquire(os.path.getsize(path) * PDF_MEMORY_FACTOR)
+        try:
+            with timer("refresh.parse"):
+                executor = get_executor()
+                try:
+                    groups_data = await parse_pdf_content(path, executor)
+                except BrokenProcessPool:
+                    #одна повторная попытка на новом пуле; если PDF снова убьет воркер - это ошибка этого PDF
+                    replace_broken_executor(executor)
+                    executor = get_executor()
+                    try:
+                        groups_data = await parse_pdf_content(path, executor)
+                    except BrokenProcessPool:
+                        replace_broken_executor(executor)
+                        raise
+        finally:
+            await memory_budget.release(reserved)
+        await run_db(store_parsed_pdf, link, validators, groups_data)
+        inc("pdf.parsed")
+        return groups_data
+    except Exception as e:
+        logger.error(f"Ошибка парсинга {link}: {e}")
+        inc("pdf.failed")
+        return None
+    finally:
+        if path and os.path.exists(path): os.unlink(path)
+
+async def process_all_pdfs(links):
+    #пики памяти считаются заново на каждое обновление
+    reset_peak_rss()
+    refresh_peak["workers"] = 0.0
+    results = await asyncio.gather(*(process_pdf(ln) for ln in links))
+    final_data = empty_groups_data()
+    success_count = 0
+    with timer("refresh.merge"):
+        for res in results:
+            if not res: continue
+            success_count += 1
+            merge_groups_data(final_data, res)
+    return final_data, success_count
@@ -0,0 +1,89 @@
+import re
+import datetime
+from collections import namedtuple
+
+from config import SEMESTER_START_DATE, SEMESTER_END_DATE, CLASS_TIMES, TZ_SARATOV
+from semester import day_info
+from cells import pair_title, pair_details
+
+#календарь группы для одной версии расписания; file_id - после первой загрузки в Telegram
+IcsFile = namedtuple("IcsFile", ["version", "filename", "content", "file_id"])
+
+#группа -> IcsFile; запись другой версии считается устаревшей и собирается заново
+ics_cache = {}
+
+#максимальная длина строки iCalendar в октетах (RFC 5545, 3.1)
+ICS_LINE_LIMIT = 75
+
+# ================= ЭКСПОРТ РАСПИСАНИЯ В ICALENDAR =================
+
+def ics_escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def ics_fold(line):
+    """Перенос длинной строки: куски до 75 октетов, продолжение начинается с пробела; UTF-8 не режется посреди символа"""
+    raw = line.encode("utf-8")
+    if len(raw) <= ICS_LINE_LIMIT: return line
+    parts, chunk, size, limit = [], [], 0, ICS_LINE_LIMIT
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > limit:
+            parts.append("".join(chunk))
+            chunk, size, limit = [], 0, ICS_LINE_LIMIT - 1
+        chunk.append(ch)
+        size += n
+    parts.append("".join(chunk))
+    return "\r\n ".join(parts)
+
+def ics_time(date, hm):
+    local = TZ_SARATOV.localize(datetime.datetime.combine(date, datetime.time(*hm)))
+    return local.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+def build_ics(grp, weeks, stamp):
+    """VCALENDAR группы на весь семестр: верхняя/нижняя недели разворачиваются по календарю семестра
+    (праздники пропускаются, переносы идут по расписанию дня-источника)"""
+    dtstamp = stamp.astimezone(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    uid_grp = re.sub(r"[^\w\-]", "", grp)
+    lines = [
+        "BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//vavilov_schedule_bot//RU", "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{ics_escape(grp)}", "X-WR-TIMEZONE:Europe/Saratov",
+    ]
+    date = SEMESTER_START_DATE
+    while date <= SEMESTER_END_DATE:
+        info = day_info(date)
+        if info.is_study_day:
+            day = weeks.get(info.parity, {}).get(info.weekday, {})
+            for p, pair in day.items():
+                times = CLASS_TIMES.get(p)
+                if not times: continue
+                details = pair_details(pair)
+                lines += [
+                    "BEGIN:VEVENT",
+                    f"UID:{date:%Y%m%d}-{p}-{uid_grp}@vavilov_schedule_bot",
+                    f"DTSTAMP:{dtstamp}",
+                    f"DTSTART:{ics_time(date, times['start'])}",
+                    f"DTEND:{ics_time(date, times['end'])}",
+                    f"SUMMARY:{ics_escape(pair_title(pair))}",
+                ]
+                if pair.room: lines.append(f"LOCATION:{ics_escape(pair.room)}")
+                lines.append(f"DESCRIPTION:{ics_escape(pair.text if not details else details + chr(10) + pair.text)}")
+                lines.append("END:VEVENT")
+        date += datetime.timedelta(days=1)
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(ics_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+def get_group_ics(grp, snap):
+    """Календарь группы для версии snap: собирается один раз на версию, дальше отдается из ics_cache.
+    None, если группы нет в расписании"""
+    weeks = snap.data.get(grp)
+    if weeks is None: return None
+    entry = ics_cache.get(grp)
+    if entry is None or entry.version != snap.version:
+        stamp = snap.last_update or datetime.datetime.now(TZ_SARATOV)
+        filename = re.sub(r"[^\w\-]", "_", grp) + ".ics"
+        entry = ics_cache[grp] = IcsFile(snap.version, filename, build_ics(grp, weeks, stamp), None)
+    return entry
+
+def remember_file_id(grp, entry, file_id):
+    """Запоминает file_id загруженного файла, если за время загрузки версия не сменилась"""
+    if ics_cache.get(grp) is entry: ics_cache[grp] = entry._replace(file_id=file_id)
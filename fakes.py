@@ -0,0 +1,134 @@
+"""Локальные заглушки Telegram Bot API и сайта университета для бенчмарков и нагрузочных тестов"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import itertools
+from email.parser import BytesParser
+from urllib.parse import parse_qsl, urlsplit
+
+# ================= МИНИМАЛЬНЫЙ HTTP/1.1 СЕРВЕР =================
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found"}
+
+async def _serve_client(reader, writer, handler):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line: break
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""): break
+                name, value = line.decode("latin-1").split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, resp_headers, resp_body = await handler(method, target, headers, body)
+            head = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}", f"Content-Length: {len(resp_body)}"]
+            head += [f"{k}: {v}" for k, v in resp_headers.items()]
+            writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + resp_body)
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close": break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_http(handler, host="127.0.0.1", port=0):
+    """Запускает сервер; handler(method, target, headers, body) -> (status, headers, body). Возвращает (server, port)"""
+    server = await asyncio.start_server(lambda r, w: _serve_client(r, w, handler), host, port)
+    return server, server.sockets[0].getsockname()[1]
+
+def parse_form(headers, body):
+    """Параметры запроса PTB: JSON, urlencoded или multipart (значения-объекты приходят JSON-строками)"""
+    content_type = headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    if content_type.startswith("multipart/form-data"):
+        msg = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        params = {}
+        for part in msg.get_payload():
+            name = part.get_param("name", header="content-disposition")
+            params[name] = part.get_payload(decode=True) if part.get_filename() else part.get_payload(decode=True).decode()
+        return params
+    return dict(parse_qsl(body.decode()))
+
+# ================= ЗАГЛУШКА TELEGRAM BOT API =================
+
+class FakeBotAPI:
+    """Отвечает на методы Bot API, считает вызовы и сообщает о доставке ответов в чат"""
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+    def __init__(self):
+        self.calls = {}
+        self.updates = asyncio.Queue()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._waiters = {}
+
+    def _message(self, params, **extra):
+        chat_id = int(params.get("chat_id", 0))
+        msg = {"message_id": next(self._message_ids), "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"}, "from": self.BOT_USER}
+        if "text" in params: msg["text"] = params["text"]
+        msg.update(extra)
+        waiter = self._waiters.pop(chat_id, None)
+        if waiter and not waiter.done(): waiter.set_result(time.perf_counter())
+        return msg
+
+    def wait_for_reply(self, chat_id):
+        """Future со временем (perf_counter) первого ответа бота в чат"""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = fut
+        return fut
+
+    async def handle(self, method, target, headers, body):
+        api_method = urlsplit(target).path.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = parse_form(headers, body)
+        if api_method == "getMe": result = self.BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"): result = self._message(params)
+        elif api_method == "sendDocument":
+            file_id = f"file{next(self._file_ids)}"
+            result = self._message(params, document={"file_id": file_id, "file_unique_id": file_id})
+        elif api_method == "getUpdates": result = await self._get_updates(float(params.get("timeout", 0)))
+        else: result = True
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        return 200, {"Content-Type": "application/json"}, payload
+
+    async def _get_updates(self, timeout):
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty(): batch.append(self.updates.get_nowait())
+        return batch
+
+# ================= ЗАГЛУШКА САЙТА С РАСПИСАНИЕМ =================
+
+class FakeSite:
+    """Страница со ссылками на PDF из папки фикстур; поддерживает ETag / If-None-Match"""
+
+    def __init__(self, fixtures_dir):
+        self.files = {}
+        for name in sorted(os.listdir(fixtures_dir)):
+            if name.lower().endswith(".pdf"):
+                with open(os.path.join(fixtures_dir, name), "rb") as f:
+                    self.files[f"/files/{name}"] = f.read()
+        links = "".join(f'<li><a href="{path}">{path}</a></li>' for path in self.files)
+        self.listing = f"<html><body><ul>{links}</ul></body></html>".encode()
+        self.requests = 0
+
+    async def handle(self, method, target, headers, body):
+        self.requests += 1
+        path = urlsplit(target).path
+        content = self.listing if path == "/schedule" else self.files.get(path)
+        if content is None: return 404, {}, b""
+        etag = '"' + hashlib.sha256(content).hexdigest()[:16] + '"'
+        if headers.get("if-none-match") == etag: return 304, {"ETag": etag}, b""
+        content_type = "text/html; charset=utf-8" if path == "/schedule" else "application/pdf"
+        return 200, {"ETag": etag, "Content-Type": content_type}, content
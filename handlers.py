@@ -1,33 +1,48 @@
+import re
+import html
 import datetime
 import asyncio
 import logging
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram import (
+    Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton,
+    InlineQueryResultArticle, InputTextMessageContent
+)
 from telegram.constants import ParseMode
 from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 
-from config import (
-    ADMIN_ID, TZ_SARATOV, schedule_cache, CLASS_TIMES, 
-    TIME_START_TO_PAIR_NUM
-)
+from config import ADMIN_ID, TZ_SARATOV, BOT_ROLE
 
 logger = logging.getLogger(__name__)
 from database import (
-    check_access, grant_access, get_user_group, set_user_group, 
-    get_user_settings, toggle_setting, revoke_access_delete_user,
-    get_allowed_users_ids, get_all_users_info, get_user_style
+    grant_access, grant_access_many, revoke_access_many, set_user_group, toggle_setting,
+    get_allowed_users_ids, get_users_page, USERS_NOTIFY_FILTERS, run_db, load_profile, has_access
+)
+from semester import day_info, nearest_study_day
+from render import (
+    get_rendered_day, get_rendered_week, get_day_name_ru, navigation_markup, week_markup, week_start, rebuild_render_cache
 )
-from parser import get_week_parity
-from tasks import update_schedule_data
+from store import schedule_store
+from export import get_group_ics, remember_file_id
+from search import schedule_index, parse_query, describe_match, encode_group, decode_group
+from tasks import update_schedule_data, schedule_notifier, update_user_notifier
+from broadcast import broadcast
+from cluster import request_refresh
+from metrics import timer, render_stats
 
 # ================= ИНТЕРФЕЙС =================
 
+#групп в строке клавиатуры выбора группы
+GROUPS_PER_ROW = 3
+
 async def send_group_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    #список групп берется из распарсенного расписания
+    groups = sorted(schedule_store.current.data)
     kb = [
-        [InlineKeyboardButton("Б-ПИ-101", callback_data="setgroup_Б-ПИ-101")],
-        [InlineKeyboardButton("Б-ПИ-102", callback_data="setgroup_Б-ПИ-102")]
+        [InlineKeyboardButton(g, callback_data=f"setgroup_{g}") for g in groups[i:i + GROUPS_PER_ROW]]
+        for i in range(0, len(groups), GROUPS_PER_ROW)
     ]
-    txt = " <b>Выберите вашу группу:</b>"
+    txt = " <b>Выберите вашу группу:</b>" if groups else "⏳ Расписание загружается, список групп появится после обновления. Нажмите /start позже."
     if update.callback_query:
         await update.callback_query.edit_message_text(txt, reply_markup=InlineKeyboardMarkup(kb), parse_mode=ParseMode.HTML)
     else:
@@ -37,84 +52,34 @@ async def group_selection_handler(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     grp = query.data.split("_")[1]
-    set_user_group(query.from_user.id, grp)
-    use_new_style = get_user_style(query.from_user.id)
-    if use_new_style:
+    await run_db(set_user_group, query.from_user.id, grp)
+    await update_user_notifier(context.job_queue, [query.from_user.id])
+    profile = await load_profile(query.from_user.id)
+    if profile and profile.use_new_style:
         await query.edit_message_text(f" <tg-emoji emoji-id='5427009714745517609'>✅</tg-emoji> Выбрана группа: <b>{grp}</b>", parse_mode=ParseMode.HTML)
     else:
         await query.edit_message_text(f"✅ Выбрана группа: <b>{grp}</b>", parse_mode=ParseMode.HTML)
     await start(update, context)
 
-def get_day_name_ru(date_obj):
-    days = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
-    return days[date_obj.weekday()]
-
 async def generate_schedule_message(user_id, target_date):
-    if target_date.weekday() == 6:  # Если воскресенье
-        target_date += datetime.timedelta(days=1)  # Переходим на понедельник
+    #выходной или праздник - показываем ближайший учебный день
+    target_date = nearest_study_day(target_date)
 
-    grp = get_user_group(user_id)
+    profile = await load_profile(user_id)
+    grp = profile.group_name if profile else None
     if not grp: return "⚠️ Группа не выбрана. Нажмите /start", None
     
-    use_new_style = get_user_style(user_id)
+    use_new_style = profile.use_new_style
 
-    if not schedule_cache['data']: 
+    if not schedule_store.current.data: 
         return ("<tg-emoji emoji-id='5451646226975955576'>⌛️</tg-emoji> Расписание загружается..." if use_new_style else "⏳ Расписание загружается..."), None
     
-    grp_data = schedule_cache['data'].get(grp)
-    if not grp_data: return f"❌ Данных для {grp} пока нет.", None
+    with timer("handler.render"):
+        text = get_rendered_day(grp, day_info(target_date), target_date, use_new_style)
+        if text is None: return f"❌ Данных для {grp} пока нет.", None
 
-    parity = get_week_parity(target_date)
-    weekday = target_date.weekday()
-    w_type = "Нижняя" if parity == 1 else "Верхняя"
-    pairs = grp_data.get(parity, {}).get(weekday, {})
-    
-    day_name = get_day_name_ru(target_date)
-    date_str = target_date.strftime('%d.%m')
-    
-    upd_time = schedule_cache['last_update'].strftime('%d.%m %H:%M') if schedule_cache['last_update'] else "Неизвестно"
-    
-    if use_new_style:
-        text = f"<tg-emoji emoji-id='5274055917766202507'>🗓</tg-emoji> <b>{day_name}</b> | {date_str}\n<tg-emoji emoji-id='5375163339154399459'>🎓</tg-emoji> {grp} ({w_type})\n<tg-emoji emoji-id='5451646226975955576'>⌛️</tg-emoji> Обновлено: {upd_time}\n{'='*25}"
-    else:
-        text = f"🗓 <b>{day_name}</b> | {date_str}\n🎓 {grp} ({w_type})\n🕒 Обновлено: {upd_time}\n{'='*25}"
-    
-    if not pairs:
-        text += ("\n<tg-emoji emoji-id='5404743771059395517'>😴</tg-emoji> Пар нет!" if use_new_style else "\n😴 Пар нет!")
-    else:
-        for p in sorted(pairs.keys()):
-            times = CLASS_TIMES.get(p)
-            t_str = f"{times['start'][0]:02}:{times['start'][1]:02} - {times['end'][0]:02}:{times['end'][1]:02}" if times else "??"
-            if use_new_style:
-                text += f"\n\n<tg-emoji emoji-id='5413704112220949842'>⏰</tg-emoji> <b>{t_str}</b>\n<tg-emoji emoji-id='5373098009640836781'>📚</tg-emoji> {pairs[p]}"
-            else:
-                text += f"\n\n⏰ <b>{t_str}</b>\n📚 {pairs[p]}"
-            
-    prev_date = target_date - datetime.timedelta(days=1)
-    if prev_date.weekday() == 6: 
-        prev_date -= datetime.timedelta(days=1)
-
-    next_date = target_date + datetime.timedelta(days=1)
-    if next_date.weekday() == 6:  
-        next_date += datetime.timedelta(days=1)
-    
-    prev_cb = f"sched_{prev_date.strftime('%Y-%m-%d')}"
-    next_cb = f"sched_{next_date.strftime('%Y-%m-%d')}"
-    today_cb = f"sched_{datetime.datetime.now(TZ_SARATOV).date().strftime('%Y-%m-%d')}"
-    
-    if use_new_style:
-        kb = [
-            [InlineKeyboardButton(f"⬅️ {get_day_name_ru(prev_date)}", callback_data=prev_cb, api_kwargs={"style": "primary"}),
-             InlineKeyboardButton(f"{get_day_name_ru(next_date)} ➡️", callback_data=next_cb, api_kwargs={"style": "primary"})],
-            [InlineKeyboardButton("Сегодня", callback_data=today_cb, api_kwargs={"icon_custom_emoji_id": "5274055917766202507"})]
-        ]
-    else:
-        kb = [
-            [InlineKeyboardButton(f"⬅️ {get_day_name_ru(prev_date)}", callback_data=prev_cb),
-             InlineKeyboardButton(f"{get_day_name_ru(next_date)} ➡️", callback_data=next_cb)],
-            [InlineKeyboardButton("📅 Сегодня", callback_data=today_cb)]
-        ]
-    return text, InlineKeyboardMarkup(kb)
+        today = datetime.datetime.now(TZ_SARATOV).date()
+        return text, navigation_markup(target_date, today, use_new_style)
 
 async def schedule_navigation_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -126,17 +91,70 @@ async def schedule_navigation_handler(update: Update, context: ContextTypes.DEFA
         await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
     except BadRequest: pass
 
+async def week_navigation_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Вся неделя одним сообщением: week_<понедельник>"""
+    query = update.callback_query
+    await query.answer()
+    profile = await load_profile(query.from_user.id)
+    if not has_access(query.from_user.id, profile) or not profile.group_name: return
+    try:
+        monday = week_start(datetime.datetime.strptime(query.data.split("_")[1], "%Y-%m-%d").date())
+        with timer("handler.render"):
+            text = get_rendered_week(profile.group_name, monday, profile.use_new_style)
+        if text is None:
+            await query.edit_message_text(f"❌ Данных для {profile.group_name} пока нет.")
+            return
+        today = datetime.datetime.now(TZ_SARATOV).date()
+        await query.edit_message_text(text=text, reply_markup=week_markup(monday, today, profile.use_new_style), parse_mode=ParseMode.HTML)
+    except BadRequest: pass
+
+async def ics_export_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Календарь группы (.ics): файл собирается один раз на версию расписания,
+    повторно отправляется уже загруженный в Telegram файл по file_id"""
+    query = update.callback_query
+    profile = await load_profile(query.from_user.id)
+    if not has_access(query.from_user.id, profile) or not profile.group_name:
+        await query.answer()
+        return
+    grp = profile.group_name
+    with timer("handler.ics"):
+        entry = get_group_ics(grp, schedule_store.current)
+    if entry is None:
+        await query.answer(f"❌ Данных для {grp} пока нет.", show_alert=True)
+        return
+    await query.answer("📥 Отправляю календарь...")
+    caption = f"📅 {grp}: расписание на семестр. Откройте файл, чтобы добавить пары в календарь."
+    if entry.file_id:
+        await context.bot.send_document(query.from_user.id, document=entry.file_id, caption=caption)
+        return
+    msg = await context.bot.send_document(query.from_user.id, document=entry.content, filename=entry.filename, caption=caption)
+    if msg.document: remember_file_id(grp, entry, msg.document.file_id)
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_chat.id
     msg_func = update.callback_query.message.reply_text if update.callback_query else update.message.reply_text
-    use_new_style = get_user_style(user_id)
+    profile = await load_profile(user_id)
+    use_new_style = profile.use_new_style if profile else False
     
-    if not check_access(user_id):
+    if not has_access(user_id, profile):
         txt = "⛔️ <b>Доступ запрещен.</b>" if not use_new_style else " <tg-emoji emoji-id='5260293700088511294'>⛔️</tg-emoji> <b>Доступ запрещен.</b>"
         await msg_func(f"{txt}\nID: <code>{user_id}</code> \n для получения доступа перешлите сообщение администратору - @Grdfree", parse_mode=ParseMode.HTML)
         return
-    grant_access(user_id)
-    grp = get_user_group(user_id)
+    if not profile:
+        #админ без строки в базе
+        await run_db(grant_access, user_id)
+        profile = await load_profile(user_id)
+    #deep link t.me/<бот>?start=g_...: расписание группы на ближайший учебный день
+    link_grp = decode_group(context.args[0]) if update.message and context.args else None
+    if link_grp and schedule_index.find_group(link_grp):
+        link_grp = schedule_index.find_group(link_grp)
+        target_date = nearest_study_day(datetime.datetime.now(TZ_SARATOV).date())
+        text = get_rendered_day(link_grp, day_info(target_date), target_date, use_new_style)
+        if text: await msg_func(text, parse_mode=ParseMode.HTML)
+        if not profile.group_name:
+            await run_db(set_user_group, user_id, link_grp)
+            await update_user_notifier(context.job_queue, [user_id])
+    grp = profile.group_name
     if not grp:
         await send_group_selection(update, context)
         return
@@ -147,9 +165,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         kb = [[KeyboardButton("📅 Расписание")], [KeyboardButton("⚙️ Настройки")]]
 
     if user_id == ADMIN_ID: kb.append([KeyboardButton("🔄 Обновить")])
+    snap = schedule_store.current
     upd_time = "..."
-    if schedule_cache['last_update']:
-        upd_time = schedule_cache['last_update'].strftime('%d.%m %H:%M')
+    if snap.last_update:
+        upd_time = snap.last_update.strftime('%d.%m %H:%M')
         
     if use_new_style:
         welcome_text = (f"<tg-emoji emoji-id='5472055112702629499'>👋</tg-emoji> <b>Главное меню</b>\n\n<tg-emoji emoji-id='5375163339154399459'>🎓</tg-emoji> Твоя группа: <b>{grp}</b>\n<tg-emoji emoji-id='5451646226975955576'>⌛️</tg-emoji> Данные от: <b>{upd_time}</b>\n\n<tg-emoji emoji-id='5406745015365943482'>⬇️</tg-emoji>")
@@ -157,12 +176,74 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         welcome_text = (f"👋 <b>Главное меню</b>\n\n🎓 Твоя группа: <b>{grp}</b>\n🕒 Данные от: <b>{upd_time}</b>\n\n👇 Выбери действие:")
         
     await msg_func(welcome_text, reply_markup=ReplyKeyboardMarkup(kb, resize_keyboard=True), parse_mode=ParseMode.HTML)
-    if not schedule_cache['data']: 
-        asyncio.create_task(update_schedule_data(context))
+    if not snap.data: 
+        if BOT_ROLE == "frontend": request_refresh()
+        else: asyncio.create_task(update_schedule_data(context))
+
+#сколько секунд Telegram кеширует ответ на inline-запрос (кеш у каждого пользователя свой)
+INLINE_CACHE_TIME = 300
+#сколько учебных дней показывать на запрос из одной группы
+INLINE_DAYS = 3
+
+def build_inline_results(text, profile, bot_username):
+    """Ответ на inline-запрос: дни группы или пары, где встречается текст (предмет, преподаватель, аудитория)"""
+    now = datetime.datetime.now(TZ_SARATOV)
+    today = now.date()
+    grp, date, weekday, rest = parse_query(text, schedule_index, today)
+    use_new_style = profile.use_new_style if profile else False
+    results = []
+    if rest:
+        parity = weekday = None
+        if date:
+            info = day_info(date)
+            parity, weekday = info.parity, info.weekday
+        matches = schedule_index.search(rest, grp, parity, weekday)
+        for i, match in enumerate(matches):
+            title, cell = describe_match(match)
+            results.append(InlineQueryResultArticle(
+                id=str(i), title=cell, description=title,
+                input_message_content=InputTextMessageContent(f"<b>{title}</b>\n📚 {cell}", parse_mode=ParseMode.HTML),
+            ))
+    else:
+        grp = grp or (profile.group_name if profile else None)
+        if grp:
+            if date:
+                dates = [nearest_study_day(date)]
+            else:
+                dates, probe = [], today
+                for _ in range(INLINE_DAYS):
+                    probe = nearest_study_day(probe)
+                    dates.append(probe)
+                    probe += datetime.timedelta(days=1)
+            markup = None
+            if bot_username:
+                markup = InlineKeyboardMarkup([[InlineKeyboardButton("Открыть в боте", url=f"https://t.me/{bot_username}?start={encode_group(grp)}")]])
+            for i, d in enumerate(dates):
+                day_text = get_rendered_day(grp, day_info(d), d, use_new_style)
+                if day_text is None: break
+                results.append(InlineQueryResultArticle(
+                    id=str(i), title=f"{grp}: {get_day_name_ru(d)}, {d:%d.%m}", description="Расписание на день",
+                    input_message_content=InputTextMessageContent(day_text, parse_mode=ParseMode.HTML), reply_markup=markup,
+                ))
+    #ответы с "сегодня", "завтра" и т.п. устаревают в полночь
+    midnight = TZ_SARATOV.localize(datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time()))
+    return results, max(1, min(INLINE_CACHE_TIME, int((midnight - now).total_seconds())))
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """@бот Б-ПИ-102 завтра / @бот физика чт / @бот ауд. 305 - из индекса в памяти, без базы и рендера"""
+    query = update.inline_query
+    profile = await load_profile(query.from_user.id)
+    if not has_access(query.from_user.id, profile):
+        await query.answer([], cache_time=INLINE_CACHE_TIME, is_personal=True)
+        return
+    with timer("handler.inline"):
+        results, cache_time = build_inline_results(query.query, profile, context.bot.username)
+    #is_personal: кеш Telegram не должен отдавать расписание пользователям без доступа
+    await query.answer(results, cache_time=cache_time, is_personal=True)
 
 async def msg_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_chat.id
-    if not check_access(user_id): return
+    if not has_access(user_id, await load_profile(user_id)): return
     txt = update.message.text
     if txt == "Расписание" or txt == "📅 Расписание":
         now = datetime.datetime.now(TZ_SARATOV).date()
@@ -172,6 +253,11 @@ async def msg_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_settings_menu(update, context)
     elif txt == "🔄 Обновить":
         if user_id != ADMIN_ID: return
+        if BOT_ROLE == "frontend":
+            #расписание обновляет отдельный процесс; новый снимок подхватится автоматически
+            request_refresh()
+            await update.message.reply_text("⏳ Запрос на обновление передан refresher.py.")
+            return
         msg = await update.message.reply_text("⏳ Запущено фоновое обновление расписания...")
         
         res = await update_schedule_data(context)
@@ -183,9 +269,9 @@ async def msg_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def send_settings_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_chat.id
-    s = get_user_settings(user_id)
-    if not s: return
-    n20, n10, n5, n_ch, use_new_style = s
+    p = await load_profile(user_id)
+    if not p: return
+    n20, n10, n5, n_ch, use_new_style = p.notify_20, p.notify_10, p.notify_5, p.notify_changes, p.use_new_style
     
     if use_new_style:
         kb = [
@@ -247,9 +333,10 @@ async def settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await send_group_selection(update, context)
         return
     if q.data == "toggle_new_style":
-        toggle_setting(user_id, "use_new_style")
+        await run_db(toggle_setting, user_id, "use_new_style")
 
-        use_new_style = get_user_style(user_id)
+        profile = await load_profile(user_id)
+        use_new_style = profile.use_new_style if profile else False
 
         await send_settings_menu(update, context)
         
@@ -272,60 +359,132 @@ async def settings_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     if q.data.startswith("toggle_"):
-        toggle_setting(user_id, q.data.replace("toggle_", "notify_"))
+        await run_db(toggle_setting, user_id, q.data.replace("toggle_", "notify_"))
+        await update_user_notifier(context.job_queue, [user_id])
         await send_settings_menu(update, context)
 
-async def add_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != ADMIN_ID: return 
-    try:
-        if not context.args:
-            await update.message.reply_text("⚠️ `/add 123456`", parse_mode=ParseMode.MARKDOWN)
-            return
-        new_user_id = int(context.args[0])
-        grant_access(new_user_id)
-        await update.message.reply_text(f"✅ ID `{new_user_id}` добавлен.", parse_mode=ParseMode.MARKDOWN)
-        try: await context.bot.send_message(new_user_id, "🔓 Доступ открыт! Жми /start")
-        except: pass
-    except ValueError:
-        await update.message.reply_text("❌ ID - это число.")
+#сколько ID максимум в одной команде или файле /add, /del
+MAX_BULK_IDS = 10_000
+#максимальный размер файла со списком ID (байт)
+MAX_BULK_FILE_SIZE = 1 * 2**20
+ID_SEPARATORS_RE = re.compile(r"[\s,;]+")
 
-async def del_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_id = update.effective_user.id
-    if user_id != ADMIN_ID: return 
-    try:
-        if not context.args:
-            await update.message.reply_text("⚠️ `/del 123456`", parse_mode=ParseMode.MARKDOWN)
-            return
-        del_target_id = int(context.args[0])
-        if del_target_id == ADMIN_ID:
+def parse_user_ids(text):
+    """ID через пробел, запятую или с новой строки. Возвращает (ID без повторов, нераспознанные куски)"""
+    ids, bad = [], []
+    for token in ID_SEPARATORS_RE.split(text):
+        if not token: continue
+        try: ids.append(int(token))
+        except ValueError: bad.append(token)
+    return list(dict.fromkeys(ids)), bad
+
+async def apply_bulk_command(update: Update, context: ContextTypes.DEFAULT_TYPE, command, text):
+    """Общая часть /add и /del: аргументы команды или содержимое присланного файла"""
+    ids, bad = parse_user_ids(text)
+    #нераспознанные куски - пользовательский текст: экранируются для HTML
+    bad_note = f"\n⚠️ Не распознано: {html.escape(', '.join(bad[:10]))}{' ...' if len(bad) > 10 else ''}" if bad else ""
+    if not ids:
+        await update.message.reply_text(f"⚠️ <code>/{command} 123456 234567 ...</code> или файл с ID и подписью <code>/{command}</code>{bad_note}", parse_mode=ParseMode.HTML)
+        return
+    if len(ids) > MAX_BULK_IDS:
+        await update.message.reply_text(f"❌ Слишком много ID: {len(ids)} (максимум {MAX_BULK_IDS}).")
+        return
+
+    if command == "add":
+        await run_db(grant_access_many, ids)
+        await update_user_notifier(context.job_queue, ids)
+        #сообщения новым пользователям уходят в фоне через общий ограничитель рассылок
+        context.application.create_task(broadcast(context.bot, ((uid, "🔓 Доступ открыт! Жми /start") for uid in ids)))
+        if len(ids) == 1: await update.message.reply_text(f"✅ ID <code>{ids[0]}</code> добавлен.{bad_note}", parse_mode=ParseMode.HTML)
+        else: await update.message.reply_text(f"✅ Добавлено ID: {len(ids)}.{bad_note}", parse_mode=ParseMode.HTML)
+        return
+
+    if ADMIN_ID in ids:
+        ids.remove(ADMIN_ID)
+        bad_note += "\n❌ Себя удалить нельзя."
+        if not ids:
             await update.message.reply_text("❌ Себя удалить нельзя.")
             return
-        success = revoke_access_delete_user(del_target_id)
-        if success:
-            await update.message.reply_text(f"🗑 ID `{del_target_id}` удален.", parse_mode=ParseMode.MARKDOWN)
-        else:
-            await update.message.reply_text(f"⚠️ ID `{del_target_id}` не найден.", parse_mode=ParseMode.MARKDOWN)
-    except ValueError:
-        await update.message.reply_text("❌ ID - это число.")
+    deleted = await run_db(revoke_access_many, ids)
+    await update_user_notifier(context.job_queue, ids)
+    if len(ids) == 1:
+        txt = f"🗑 ID <code>{ids[0]}</code> удален." if deleted else f"⚠️ ID <code>{ids[0]}</code> не найден."
+        await update.message.reply_text(txt + bad_note, parse_mode=ParseMode.HTML)
+    else:
+        await update.message.reply_text(f"🗑 Удалено: {deleted} из {len(ids)}.{bad_note}", parse_mode=ParseMode.HTML)
+
+async def add_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID: return
+    await apply_bulk_command(update, context, "add", " ".join(context.args or []))
+
+async def del_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID: return
+    await apply_bulk_command(update, context, "del", " ".join(context.args or []))
+
+async def bulk_file_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Файл со списком ID и подписью /add или /del"""
+    if update.effective_user.id != ADMIN_ID: return
+    command = update.message.caption.split()[0].lstrip("/").split("@")[0]
+    doc = update.message.document
+    if doc.file_size and doc.file_size > MAX_BULK_FILE_SIZE:
+        await update.message.reply_text(f"❌ Файл больше {MAX_BULK_FILE_SIZE // 2**20} МиБ.")
+        return
+    content = await (await doc.get_file()).download_as_bytearray()
+    await apply_bulk_command(update, context, command, content.decode("utf-8", errors="replace"))
 
 async def send_all_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id == ADMIN_ID and context.args:
         txt = " ".join(context.args)
-        ids = get_allowed_users_ids()
-        for uid in ids:
-            try: await context.bot.send_message(uid, f"<b>📢 Уведомление от администратора:</b>\n\n{txt}", parse_mode=ParseMode.HTML)
-            except: pass
-        await update.message.reply_text("📬 Отправлено")
+        ids = await run_db(get_allowed_users_ids)
+        msg = f"<b>📢 Уведомление от администратора:</b>\n\n{txt}"
+        status = await update.message.reply_text(f"📬 Рассылка запущена: {len(ids)} получателей...")
 
-async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        #рассылка идет в фоне, чтобы не задерживать обработку остальных апдейтов
+        async def run_broadcast():
+            result = await broadcast(context.bot, ((uid, msg) for uid in ids))
+            if result.blocked: await schedule_notifier(context.job_queue)
+            await status.edit_text(f"📬 Отправлено: {result}")
+        context.application.create_task(run_broadcast())
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != ADMIN_ID: return
+    await update.message.reply_text(render_stats(), parse_mode=ParseMode.HTML)
+
+async def rollback_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/rollback - вернуть предыдущую версию расписания, /rollback N - версию N"""
     if update.effective_user.id != ADMIN_ID: return
-    users = get_all_users_info()
-    if not users:
-        await update.message.reply_text("📭 База пуста.")
+    if BOT_ROLE == "frontend":
+        #история версий своя у каждого процесса: откат одного front-end'а разошелся бы с остальными
+        #и с refresher.py и пропал бы при перезапуске
+        await update.message.reply_text("⚠️ /rollback работает только в режиме standalone: front-end'ы берут расписание из снимка refresher.py.")
         return
-    msg = "👥 <b>Список пользователей:</b>\n\n"
-    for u in users:
+    if context.args:
+        try: version = int(context.args[0])
+        except ValueError:
+            await update.message.reply_text("❌ Версия - это число.")
+            return
+    else:
+        version = None
+    snap = schedule_store.rollback(version)
+    if snap is None:
+        kept = ", ".join(str(s.version) for s in schedule_store.history) or "-"
+        await update.message.reply_text(f"⚠️ Такой версии нет. В памяти: {kept}")
+        return
+    rebuild_render_cache(snap)
+    schedule_index.update(snap)
+    await schedule_notifier(context.job_queue)
+    upd_time = snap.last_update.strftime('%d.%m %H:%M') if snap.last_update else "?"
+    await update.message.reply_text(f"↩️ Текущая версия расписания: {snap.version} (от {upd_time})")
+
+#пользователей на одной странице /users (лимит Telegram - 4096 символов на сообщение)
+USERS_PAGE_SIZE = 25
+
+async def render_users_page(cursor, forward, group, notify):
+    rows, has_prev, has_next, total = await run_db(get_users_page, cursor, forward, USERS_PAGE_SIZE, group, notify)
+    if not rows: return "📭 Пользователей не найдено.", None
+    filters_note = "".join(f" [{html.escape(f)}]" for f in (group, notify and f"уведомления: {notify}") if f)
+    msg = f"👥 <b>Список пользователей</b>{filters_note} ({total}):\n\n"
+    for u in rows:
         uid, is_allowed, group_name, n20, n10, n5, n_ch, use_new_style = u
         notif_time = []
         if n20: notif_time.append("20")
@@ -333,5 +492,37 @@ async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if n5: notif_time.append("5")
         time_icons = f"⏰{','.join(notif_time)}" if notif_time else "🔕"
         change_icon = "📝" if n_ch else ""
-        msg += f"<code>{uid}</code> [{group_name or '?'}] - <a href='tg://user?id={uid}'>Ссылка 1</a> <a href='tg://openmessage?user_id={uid}'>Ссылка 2</a> {time_icons} {change_icon}\n"
-    await update.message.reply_text(msg, parse_mode=ParseMode.HTML)
+        msg += f"<code>{uid}</code> [{html.escape(group_name or '?')}] - <a href='tg://user?id={uid}'>Ссылка 1</a> <a href='tg://openmessage?user_id={uid}'>Ссылка 2</a> {time_icons} {change_icon}\n"
+
+    #курсор - граничный user_id страницы; фильтры едут в callback_data (лимит 64 байта): группа -
+    #только из расписания (list_users_command), ее название по шаблону шапки укладывается в лимит
+    suffix = f"{notify or ''}_{group or ''}"
+    nav = []
+    if has_prev: nav.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"users_p_{rows[0][0]}_{suffix}"))
+    if has_next: nav.append(InlineKeyboardButton("Вперед ➡️", callback_data=f"users_n_{rows[-1][0]}_{suffix}"))
+    return msg, InlineKeyboardMarkup([nav]) if nav else None
+
+async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/users [группа] [on|off] - постранично, с фильтром по группе и уведомлениям о парах"""
+    if update.effective_user.id != ADMIN_ID: return
+    args = context.args or []
+    notify = next((a for a in args if a in USERS_NOTIFY_FILTERS), None)
+    group = " ".join(a for a in args if a not in USERS_NOTIFY_FILTERS) or None
+    if group is not None:
+        known = schedule_index.find_group(group)
+        if known is None:
+            await update.message.reply_text(f"❌ Группы {html.escape(group[:64])} нет в расписании.", parse_mode=ParseMode.HTML)
+            return
+        group = known
+    text, markup = await render_users_page(None, True, group, notify)
+    await update.message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+
+async def users_page_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    await query.answer()
+    if query.from_user.id != ADMIN_ID: return
+    _, direction, cursor, notify, group = query.data.split("_", 4)
+    text, markup = await render_users_page(int(cursor), direction == "n", group or None, notify or None)
+    try:
+        await query.edit_message_text(text, reply_markup=markup, parse_mode=ParseMode.HTML)
+    except BadRequest: pass
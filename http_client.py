@@ -0,0 +1,133 @@
+import os
+import codecs
+import tempfile
+import asyncio
+import hashlib
+import logging
+from collections import namedtuple
+from urllib.parse import urlsplit
+
+import httpx
+
+from config import (
+    HEADERS, HTTP_CONNECT_TIMEOUT, PAGE_TIMEOUT,
+    HTTP_MAX_CONNECTIONS, HTTP_PER_HOST_LIMIT, HTTP_RETRIES, HTTP_BACKOFF
+)
+
+logger = logging.getLogger(__name__)
+
+#результат потокового чтения страницы: тело отдано в feed, sha256 посчитан по ходу чтения
+ScanResult = namedtuple("ScanResult", ["status", "headers", "sha256"])
+#результат загрузки в файл: path - временный файл с телом
+DownloadResult = namedtuple("DownloadResult", ["status", "headers", "path", "size", "sha256"])
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def conditional_headers(entry):
+    """Валидаторы из кеша загрузок (If-None-Match / If-Modified-Since); общие HEADERS добавляет клиент"""
+    headers = {}
+    if entry:
+        etag, last_modified = entry[0], entry[1]
+        if etag: headers['If-None-Match'] = etag
+        if last_modified: headers['If-Modified-Since'] = last_modified
+    return headers
+
+# ================= ОБЩИЙ АСИНХРОННЫЙ HTTP-КЛИЕНТ =================
+
+class HttpClient:
+    """Пул keep-alive соединений с ограничением на хост и повторами с backoff"""
+
+    def __init__(self, headers=HEADERS, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=PAGE_TIMEOUT,
+                 max_connections=HTTP_MAX_CONNECTIONS, per_host_limit=HTTP_PER_HOST_LIMIT,
+                 retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        self.headers = dict(headers)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.retries = retries
+        self.backoff = backoff
+        self._client = None
+        self._host_slots = {}
+
+    def _get_client(self):
+        #создается лениво внутри работающего event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    async def _request(self, url, headers, timeout, consume):
+        """GET с повторами; consume(response) читает тело потоком и возвращает результат"""
+        client = self._get_client()
+        req_timeout = httpx.Timeout(timeout or self.read_timeout, connect=self.connect_timeout)
+        attempt = 0
+        while True:
+            try:
+                async with self._host_slot(url):
+                    async with client.stream("GET", url, headers=headers, timeout=req_timeout) as response:
+                        if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                            raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+                        if response.status_code != 304: response.raise_for_status()
+                        return await consume(response)
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if attempt >= self.retries: raise
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in RETRY_STATUSES: raise
+                delay = self.backoff * 2 ** attempt
+                attempt += 1
+                logger.warning(f"{url}: {e}, повтор {attempt}/{self.retries} через {delay:.1f} с")
+                await asyncio.sleep(delay)
+
+    async def scan_text(self, url, feed, headers=None, timeout=None):
+        """GET с потоковой передачей декодированного текста в feed(str) по кускам (тело не копится в памяти).
+        Возвращает ScanResult; при 304 feed не вызывается"""
+        async def consume(response):
+            digest = hashlib.sha256()
+            if response.status_code != 304:
+                decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+                async for chunk in response.aiter_bytes():
+                    digest.update(chunk)
+                    feed(decoder.decode(chunk))
+                feed(decoder.decode(b"", final=True))
+            return ScanResult(response.status_code, response.headers, digest.hexdigest())
+        return await self._request(url, headers, timeout, consume)
+
+    async def download(self, url, headers=None, timeout=None, suffix=""):
+        """GET с потоковой записью тела во временный файл (тело не держится в памяти).
+        Файл удаляет вызывающий; при 304 файл не создается (path = None)"""
+        async def consume(response):
+            if response.status_code == 304:
+                return DownloadResult(304, response.headers, None, 0, None)
+            digest = hashlib.sha256()
+            size = 0
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+                try:
+                    async for chunk in response.aiter_bytes():
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+                except BaseException:
+                    f.close()
+                    os.unlink(f.name)
+                    raise
+            return DownloadResult(response.status_code, response.headers, f.name, size, digest.hexdigest())
+        return await self._request(url, headers, timeout, consume)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+#общий клиент для поиска ссылок и скачивания PDF
+http_client = HttpClient()
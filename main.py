@@ -1,20 +1,31 @@
 import logging
+import argparse
 from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     filters,
 )
 
-from config import BOT_TOKEN, ADMIN_ID, schedule_cache
-from database import init_db
-from tasks import update_schedule_data, notifier
+from config import (
+    BOT_TOKEN, ADMIN_ID, METRICS_HOST, METRICS_PORT, CONCURRENT_UPDATES, BOT_MODE, BOT_ROLE, SNAPSHOT_POLL_INTERVAL, NOTIFIER_REARM_INTERVAL,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS
+)
+from metrics import start_metrics_server
+from database import init_db, close_db
+from snapshot import restore_schedule_cache
+from semester import load_calendar
+from engine import shutdown_executor
+from http_client import http_client
+from tasks import refresh_job, notifier_watchdog, snapshot_watch_job
 from handlers import (
-    start, add_user_command, del_user_command, send_all_command,
-    list_users_command, msg_handler, group_selection_handler,
-    schedule_navigation_handler, settings_handler
+    start, add_user_command, del_user_command, bulk_file_handler, send_all_command,
+    list_users_command, users_page_handler, stats_command, rollback_command, msg_handler,
+    group_selection_handler, schedule_navigation_handler, week_navigation_handler, ics_export_handler,
+    settings_handler, inline_query_handler
 )
 
 logging.basicConfig(
@@ -23,30 +34,84 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def main():
-    init_db()
-    req = HTTPXRequest(connection_pool_size=8, connect_timeout=60, read_timeout=60)
-    app = Application.builder().token(BOT_TOKEN).request(req).build()
+async def on_startup(app):
+    if METRICS_PORT:
+        app.bot_data["metrics_server"] = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+
+async def on_shutdown(app):
+    if app.bot_data.get("metrics_server"):
+        app.bot_data["metrics_server"].close()
+    shutdown_executor()
+    await http_client.aclose()
+    close_db()
+
+def build_application(base_url=None):
+    """Приложение со всеми обработчиками; base_url - адрес Bot API (заглушка в бенчмарках)"""
+    #апдейты обрабатываются параллельно, поэтому и соединений к Bot API нужно не меньше
+    req = HTTPXRequest(connection_pool_size=max(8, CONCURRENT_UPDATES), connect_timeout=60, read_timeout=60)
+    builder = (
+        Application.builder().token(BOT_TOKEN).request(req).concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(on_startup).post_shutdown(on_shutdown)
+    )
+    if base_url: builder = builder.base_url(base_url)
+    app = builder.build()
     
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("add", add_user_command))
     app.add_handler(CommandHandler("del", del_user_command))
     app.add_handler(CommandHandler("send_all", send_all_command))
     app.add_handler(CommandHandler("users", list_users_command))
+    app.add_handler(CommandHandler("stats", stats_command))
+    app.add_handler(CommandHandler("rollback", rollback_command))
     
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, msg_handler))
+    app.add_handler(MessageHandler(filters.Document.ALL & filters.CaptionRegex(r"^/(add|del)\b"), bulk_file_handler))
     
     app.add_handler(CallbackQueryHandler(group_selection_handler, pattern="^setgroup_"))
     app.add_handler(CallbackQueryHandler(schedule_navigation_handler, pattern="^sched_"))
+    app.add_handler(CallbackQueryHandler(week_navigation_handler, pattern="^week_"))
+    app.add_handler(CallbackQueryHandler(ics_export_handler, pattern="^ics$"))
+    app.add_handler(CallbackQueryHandler(users_page_handler, pattern="^users_"))
     app.add_handler(CallbackQueryHandler(settings_handler))
+    #inline-режим нужно включить у @BotFather (/setinline)
+    app.add_handler(InlineQueryHandler(inline_query_handler))
+    return app
 
-    app.job_queue.run_repeating(notifier, interval=60, first=10)
-    app.job_queue.run_repeating(update_schedule_data, interval=3600)
-    
-    app.job_queue.run_once(update_schedule_data, 1)
+def main():
+    ap = argparse.ArgumentParser(description="Telegram-бот с расписанием")
+    ap.add_argument("--webhook-port", type=int, default=WEBHOOK_PORT, help="порт webhook этого процесса (несколько front-end'ов)")
+    args = ap.parse_args()
+
+    init_db()
+    #четность, дни недели и праздники на весь семестр - один раз при старте
+    load_calendar()
+    #снимок с диска дает рабочее расписание сразу, сеть обновит его в фоне
+    restore_schedule_cache()
+    app = build_application()
+
+    #notifier срабатывает только в минуты, когда есть что отправить (см. tasks.arm_notifier);
+    #страховочная задача строит индекс при старте и перезаводит notifier, если запуск пропущен или упал
+    app.job_queue.run_repeating(notifier_watchdog, NOTIFIER_REARM_INTERVAL, first=0, name="notifier_watchdog")
+    if BOT_ROLE == "frontend":
+        #расписание публикует refresher.py; notifier запустит тот front-end, что захватит блокировку
+        app.job_queue.run_repeating(snapshot_watch_job, SNAPSHOT_POLL_INTERVAL, first=0, name="snapshot_watch")
+    else:
+        #обновление расписания само выбирает интервал до следующего запуска (см. tasks.refresh_job)
+        app.job_queue.run_once(refresh_job, 1, name="refresh")
 
-    print(f"Bot started. Admin: {ADMIN_ID}")
-    app.run_polling(drop_pending_updates=True)
+    print(f"Bot started ({BOT_MODE}, {BOT_ROLE}). Admin: {ADMIN_ID}")
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_URL: raise SystemExit("Для BOT_MODE = \"webhook\" нужно задать WEBHOOK_URL")
+        #TLS на обратном прокси: сам бот слушает обычный HTTP
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN, port=args.webhook_port, url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None, max_connections=WEBHOOK_MAX_CONNECTIONS,
+            #перезапуск одного из front-end'ов не должен выбрасывать апдейты остальных
+            drop_pending_updates=BOT_ROLE == "standalone",
+        )
+    else:
+        app.run_polling(drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()
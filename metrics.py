@@ -0,0 +1,147 @@
+import time
+import resource
+import asyncio
+import logging
+from bisect import bisect_left
+
+from config import METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+#границы корзин гистограмм времени (сек)
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, float("inf"))
+
+counters = {}
+histograms = {}
+
+# ================= МЕТРИКИ =================
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max: self.max = value
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank: return min(bound, self.max)
+        return self.max
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class _NullTimer:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_TIMER = _NullTimer()
+
+def timer(name):
+    """with timer("parse"): ... - время блока в гистограмму name; при выключенных метриках ничего не делает"""
+    return _Timer(name) if METRICS_ENABLED else _NULL_TIMER
+
+def inc(name, value=1):
+    if METRICS_ENABLED: counters[name] = counters.get(name, 0) + value
+
+def observe(name, value):
+    if not METRICS_ENABLED: return
+    hist = histograms.get(name)
+    if hist is None: hist = histograms[name] = Histogram()
+    hist.observe(value)
+
+def reset_peak_rss():
+    """Сбрасывает пик RSS текущего процесса (VmHWM, Linux 4.0+); где не поддерживается - пик остается за все время жизни"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    """Пик RSS текущего процесса с последнего reset_peak_rss (МиБ)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    #без /proc: ru_maxrss - пик за все время жизни (в КиБ на Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def render_stats():
+    """Текст для команды /stats"""
+    if not METRICS_ENABLED: return "Метрики выключены (METRICS_ENABLED = False)."
+    lines = ["<b>Тайминги</b> (кол-во | сред | p50 | p99 | макс, мс):"]
+    for name in sorted(histograms):
+        h = histograms[name]
+        lines.append(f"<code>{name}</code>: {h.count} | {h.total / h.count * 1000:.1f} | {h.quantile(0.5) * 1000:.1f} | {h.quantile(0.99) * 1000:.1f} | {h.max * 1000:.1f}")
+    if counters:
+        lines.append("\n<b>Счетчики:</b>")
+        lines.extend(f"<code>{name}</code>: {counters[name]}" for name in sorted(counters))
+    return "\n".join(lines)
+
+def render_prometheus():
+    """Метрики в текстовом формате Prometheus"""
+    out = []
+    for name in sorted(counters):
+        metric = "bot_" + name.replace(".", "_") + "_total"
+        out.append(f"# TYPE {metric} counter\n{metric} {counters[name]}")
+    for name in sorted(histograms):
+        h = histograms[name]
+        metric = "bot_" + name.replace(".", "_") + "_seconds"
+        out.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS, h.counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            out.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+        out.append(f"{metric}_sum {h.total}\n{metric}_count {h.count}")
+    return "\n".join(out) + "\n"
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await reader.readline()
+        #заголовки запроса не нужны, но их надо дочитать
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""): pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+            status, body = "200 OK", render_prometheus().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def start_metrics_server(host, port):
+    """Локальный эндпоинт GET /metrics для Prometheus"""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -1,74 +1,71 @@
-import datetime
-import requests
 import pdfplumber
-import io
+import os
+import re
+import json
+import hashlib
 import logging
-from bs4 import BeautifulSoup
-from urllib.parse import unquote, urljoin
+import threading
+import multiprocessing
+from collections import OrderedDict
+from pdfminer.pdftypes import resolve1, PDFObjRef, PDFStream
+from pdfminer.psparser import PSLiteral
 
 from config import (
-    SCHEDULE_URL, 
-    SEARCH_QUERY_PDF, 
-    SEMESTER_START_DATE, 
-    TZ_SARATOV, 
     TIME_START_TO_PAIR_NUM, 
-    HEADERS
+    PDF_TIMEOUT,
+    PAGE_CACHE_SIZE
 )
+from database import get_fetch_entry, save_fetch_entry, run_db
+from http_client import http_client, conditional_headers
+from metrics import reset_peak_rss, peak_rss_mb
 
 logger = logging.getLogger(__name__)
 
+#версия разбора PDF: увеличивать при любом изменении результата парсинга - сохраненные в кеше загрузок
+#результаты другой версии не используются, и неизменившиеся PDF разбираются заново
+PARSER_VERSION = 1
+
 # ================= ПАРСЕР (СИНХРОННАЯ ЧАСТЬ) =================
 
-def get_week_parity(target_date=None):
-    if target_date is None: target_date = datetime.datetime.now(TZ_SARATOV).date()
-    delta = target_date - SEMESTER_START_DATE
-    return (delta.days // 7) % 2
+#название группы в шапке таблицы, например "Б-ПИ-101" или "Группа Б-ПИ-101": ячейка шапки целиком
+GROUP_NAME_RE = re.compile(r"(?:ГРУППА\s+)?([А-ЯЁ]{1,4}-[А-ЯЁ]{1,6}-\d{2,4}[А-ЯЁ]?)")
+#грубая проверка страницы до поиска таблиц (текст символов страницы идет без пробелов)
+GROUP_NAME_HINT_RE = re.compile(r"[А-ЯЁ]{1,4}-[А-ЯЁ]{1,6}-\d{2,4}")
 
-def find_all_pdf_links():
-    """Находит ВСЕ ссылки на PDF, соответствующие запросу"""
-    try:
-        response = requests.get(SCHEDULE_URL, headers=HEADERS, timeout=15)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        query = SEARCH_QUERY_PDF.lower().replace(" ", "")
-        links = []
-        for a in soup.find_all('a', href=True):
-            full_url = urljoin(SCHEDULE_URL, a['href'])
-            decoded_url = unquote(full_url).lower().replace(" ", "")
-            if '.pdf' in decoded_url and query in decoded_url:
-                links.append(full_url)
-        return list(set(links)) 
-    except Exception as e:
-        logger.error(f"Поиск ссылок PDF: {e}")
-        return []
-
-def process_time_block(rows, pair_num, day_idx, groups_data):
-    if not rows or pair_num == -1 or day_idx == -1: return
-
-    target_groups = ["Б-ПИ-101", "Б-ПИ-102"]
-
-    for g_idx, g_name in enumerate(target_groups):
-        col_idx = 2 + g_idx
-        
-        texts = []
-        for r in rows:
-            if col_idx >= len(r):
-                val = None
-            else:
-                val = r[col_idx]
-            
-            final_text = None
-            
-            if val is None:
-                if g_name == "Б-ПИ-102":
-                    if 2 < len(r) and r[2]:
-                        final_text = str(r[2]).strip().replace('\n', ' ')
-            elif val == "":
-                final_text = None
-            else:
-                final_text = str(val).strip().replace('\n', ' ')
-            
-            texts.append(final_text)
+def group_name(cell):
+    """Название группы, если ячейка - только оно (перенос строки внутри названия допускается), иначе None"""
+    if not cell: return None
+    text = re.sub(r"\s*-\s*", "-", " ".join(str(cell).split())).upper()
+    m = GROUP_NAME_RE.fullmatch(text)
+    return m.group(1) if m else None
+
+def find_group_columns(row):
+    """Колонки групп по строке шапки: {индекс колонки: группа}. Пустой словарь - это не шапка.
+    Шапка - строка без дня и времени, все непустые ячейки групп которой - названия групп
+    (строка с "поток Б-ПИ-101, Б-ПИ-102" в ячейке пары шапкой не считается)"""
+    if match_day(row[0]) != -1 or match_pair_num(row[1]) != -1: return {}
+    columns = {}
+    for col_idx, cell in enumerate(row):
+        if col_idx < 2 or not cell or not str(cell).strip(): continue
+        name = group_name(cell)
+        if name is None: return {}
+        columns[col_idx] = name
+    return columns
+
+def cell_text(r, col_idx, first_col):
+    """Текст ячейки группы. None в ячейке - она объединена с соседней слева (общая пара потока)"""
+    while first_col <= col_idx < len(r) and r[col_idx] is None:
+        col_idx -= 1
+    if col_idx < first_col or col_idx >= len(r) or not r[col_idx]: return None
+    return str(r[col_idx]).strip().replace('\n', ' ')
+
+def process_time_block(rows, pair_num, day_idx, groups_data, columns):
+    if not rows or pair_num == -1 or day_idx == -1 or not columns: return
+
+    first_col = min(columns)
+    for col_idx, g_name in columns.items():
+        texts = [cell_text(r, col_idx, first_col) for r in rows]
+        if g_name not in groups_data: groups_data[g_name] = {0: {}, 1: {}}
 
         if len(texts) == 1:
             val = texts[0]
@@ -90,82 +87,222 @@ def process_time_block(rows, pair_num, day_idx, groups_data):
                 if day_idx not in groups_data[g_name][1]: groups_data[g_name][1][day_idx] = {}
                 groups_data[g_name][1][day_idx][pair_num] = bot_val
 
-def parse_pdf_task(link):
-    """Задача для одного потока: скачать и распарсить один PDF"""
-    groups_data = { "Б-ПИ-101": {0: {}, 1: {}}, "Б-ПИ-102": {0: {}, 1: {}} }
+def decode_groups_data(raw):
+    """Восстанавливает int-ключи недель, дней и пар после JSON"""
+    return {
+        g: {int(w): {int(d): {int(p): t for p, t in pairs.items()} for d, pairs in days.items()}
+            for w, days in weeks.items()}
+        for g, weeks in raw.items()
+    }
+
+def load_groups_data(payload):
+    """Восстанавливает сохраненный в JSON результат парсинга"""
+    return decode_groups_data(json.loads(payload))
+
+def empty_groups_data():
+    return {}
+
+def merge_groups_data(target, part):
+    """Вливает результат парсинга части PDF (или целого PDF) в общий словарь"""
+    for g in part: # g = Группа
+        if g not in target: target[g] = {0: {}, 1: {}}
+        for w in [0, 1]: # w = Неделя
+            for day_idx, pairs in part[g][w].items():
+                if day_idx not in target[g][w]:
+                    target[g][w][day_idx] = {}
+                target[g][w][day_idx].update(pairs)
+    return target
+
+DAYS_MAP = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
+#день недели в первой колонке (в PDF бывает записан повернутым - задом наперед)
+DAY_RE = re.compile("|".join(DAYS_MAP + [d[::-1] for d in DAYS_MAP]))
+DAY_TO_IDX = {**{d: i for i, d in enumerate(DAYS_MAP)}, **{d[::-1]: i for i, d in enumerate(DAYS_MAP)}}
+#время во второй колонке: "8.30", "08:30", "8.30-10.00"
+TIME_RE = re.compile(r"(\d{1,2})[.:](\d{2})")
+START_TO_PAIR_NUM = {tuple(map(int, t.split("."))): p for t, p in TIME_START_TO_PAIR_NUM.items()}
+
+TABLE_SETTINGS = {"vertical_strategy": "lines", "horizontal_strategy": "lines"}
+
+#таблицы уже разобранных страниц: хеш содержимого страницы -> таблицы (в каждом процессе свой;
+#в режиме "threads" общий для потоков - поэтому все обращения под _page_tables_lock)
+_page_tables_cache = OrderedDict()
+_page_tables_lock = threading.Lock()
+
+def match_day(cell):
+    if not cell: return -1
+    m = DAY_RE.search(str(cell).replace('\n', '').replace(' ', '').lower())
+    return DAY_TO_IDX[m.group(0)] if m else -1
+
+def match_pair_num(cell):
+    if not cell: return -1
+    for m in TIME_RE.finditer(str(cell)):
+        p_num = START_TO_PAIR_NUM.get((int(m.group(1)), int(m.group(2))))
+        if p_num: return p_num
+    return -1
 
+def page_has_schedule(page):
+    """Дешевая проверка по символам страницы до поиска таблиц: есть ли шапка группы или время пар.
+    Время проверяется для страниц-продолжений, у которых шапка осталась на предыдущей странице"""
+    text = "".join(ch["text"] for ch in page.chars)
+    compact = text.replace(" ", "")
+    return bool(GROUP_NAME_HINT_RE.search(compact.upper()) or match_pair_num(text) != -1)
+
+def hash_pdf_object(h, obj, memo, path=()):
+    """Дописывает в хеш объект PDF целиком: словари, массивы, потоки (данные и словарь), ссылки - по содержимому.
+    memo: objid -> дайджест уже посчитанных косвенных объектов (шрифты и XObject общие у страниц одного PDF)"""
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in path:
+            h.update(b"R%d" % obj.objid)
+            return
+        digest = memo.get(obj.objid)
+        if digest is None:
+            sub = hashlib.blake2b(digest_size=16)
+            hash_pdf_object(sub, resolve1(obj), memo, path + (obj.objid,))
+            digest = memo[obj.objid] = sub.digest()
+        h.update(digest)
+    elif isinstance(obj, PDFStream):
+        h.update(b"S")
+        hash_pdf_object(h, obj.attrs, memo, path)
+        h.update(obj.get_data())
+    elif isinstance(obj, dict):
+        h.update(b"D")
+        for k in sorted(obj, key=str):
+            h.update(str(k).encode())
+            hash_pdf_object(h, obj[k], memo, path)
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"A")
+        for item in obj: hash_pdf_object(h, item, memo, path)
+    elif isinstance(obj, PSLiteral):
+        h.update(b"/" + str(obj.name).encode())
+    else:
+        h.update(repr(obj).encode())
+
+def page_content_hash(page, memo=None):
+    """Ключ кеша таблиц: размер страницы, потоки содержимого и ресурсы (шрифты с кодировками, XObject) -
+    страница "/Fm0 Do" с другой формой или другим подмножеством шрифта дает другой ключ"""
+    memo = {} if memo is None else memo
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(page.bbox).encode())
+    for stream in page.page_obj.contents:
+        h.update(resolve1(stream).get_data())
+    hash_pdf_object(h, page.page_obj.resources, memo)
+    return h.digest()
+
+def page_tables(page, memo=None):
+    """Таблицы страницы: из кеша по хешу содержимого, иначе extract_tables (если на странице есть расписание).
+    memo - общий для страниц одного PDF кеш дайджестов ресурсов"""
     try:
-        response = requests.get(link, headers=HEADERS, timeout=30)
-        
+        key = page_content_hash(page, memo)
+    except Exception:
+        key = None
+    if key is not None:
+        with _page_tables_lock:
+            tables = _page_tables_cache.get(key)
+            if tables is not None:
+                _page_tables_cache.move_to_end(key)
+                return tables
+    #сам разбор - без блокировки: страницы разбираются параллельно
+    tables = page.extract_tables(TABLE_SETTINGS) if page_has_schedule(page) else []
+    if key is not None:
+        with _page_tables_lock:
+            _page_tables_cache[key] = tables
+            if len(_page_tables_cache) > PAGE_CACHE_SIZE: _page_tables_cache.popitem(last=False)
+    return tables
 
-        with pdfplumber.open(io.BytesIO(response.content)) as pdf:
-            
-            
-            for page_num, page in enumerate(pdf.pages, 1):
-                tables = page.extract_tables({"vertical_strategy": "lines", "horizontal_strategy": "lines"})
-                if not tables: 
-                    continue
-
-                for table in tables:
-                    days_map = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота"]
-                    current_day_idx = -1
-                    
-                    block_rows = []
-                    current_pair_num = -1
-
-                    for row in table:
-                        if len(row) < 2: continue
-                        
-                        
-                        raw_day = str(row[0]).replace('\n', '').replace(' ', '').lower() if row[0] else ""
-                        for idx, d_name in enumerate(days_map):
-                            if d_name in raw_day or d_name[::-1] in raw_day:
-                                process_time_block(block_rows, current_pair_num, current_day_idx, groups_data)
-                                block_rows = []
-                                current_pair_num = -1
-                                current_day_idx = idx
-                                break
-                        if current_day_idx == -1: continue
-
-                        
-                        raw_time = str(row[1]).replace('\n', ' ').strip() if row[1] else ""
-                        new_pair_num = -1
-                        for t_str, p_num in TIME_START_TO_PAIR_NUM.items():
-                            if t_str in raw_time: new_pair_num = p_num; break
-                        
-                        if new_pair_num != -1:
-                            process_time_block(block_rows, current_pair_num, current_day_idx, groups_data)
-                            current_pair_num = new_pair_num
-                            block_rows = [row]
-                        else:
-                            if current_pair_num != -1:
-                                block_rows.append(row)
-
-                    process_time_block(block_rows, current_pair_num, current_day_idx, groups_data)
-
-        return groups_data
-    except Exception as e:
-        logger.error(f"Ошибка парсинга {link}: {e}")
-        return None
-
-def normalize_text(text):
-    if not text: return ""
-    return "".join(text.lower().split())
-
-def is_schedule_changed(old_data, new_data):
-    if not old_data or not new_data: return True
-    for g_name in ["Б-ПИ-101", "Б-ПИ-102"]:
-        old_g = old_data.get(g_name, {})
-        new_g = new_data.get(g_name, {})
-        for week in [0, 1]:
-            old_w = old_g.get(week, {})
-            new_w = new_g.get(week, {})
-            all_days = set(old_w.keys()) | set(new_w.keys())
-            for day in all_days:
-                old_d = old_w.get(day, {})
-                new_d = new_w.get(day, {})
-                all_p = set(old_d.keys()) | set(new_d.keys())
-                for pair in all_p:
-                    if normalize_text(old_d.get(pair, "")) != normalize_text(new_d.get(pair, "")):
-                        return True
-    return False
+def process_table(table, groups_data, columns):
+    current_day_idx = -1
+    block_rows = []
+    current_pair_num = -1
+
+    for row in table:
+        if len(row) < 2: continue
+
+        new_pair_num = match_pair_num(row[1])
+        header = find_group_columns(row) if new_pair_num == -1 else None
+        if header:
+            process_time_block(block_rows, current_pair_num, current_day_idx, groups_data, columns)
+            block_rows = []
+            current_pair_num = -1
+            columns = header
+            continue
+
+        day_idx = match_day(row[0])
+        if day_idx != -1:
+            process_time_block(block_rows, current_pair_num, current_day_idx, groups_data, columns)
+            block_rows = []
+            current_pair_num = -1
+            current_day_idx = day_idx
+        if current_day_idx == -1: continue
+
+        if new_pair_num != -1:
+            process_time_block(block_rows, current_pair_num, current_day_idx, groups_data, columns)
+            current_pair_num = new_pair_num
+            block_rows = [row]
+        else:
+            if current_pair_num != -1:
+                block_rows.append(row)
+
+    process_time_block(block_rows, current_pair_num, current_day_idx, groups_data, columns)
+    return columns
+
+def split_before_header(table):
+    """(строки до первой шапки, строки начиная с нее); без шапки - вся таблица в первой части"""
+    for i, row in enumerate(table):
+        if len(row) >= 2 and find_group_columns(row): return table[:i], table[i:]
+    return table, []
+
+def extract_pages(pages, groups_data, columns=None):
+    """Разбирает таблицы на переданных страницах и дописывает пары в groups_data.
+    columns - колонки групп из шапки (таблица может продолжаться без шапки на следующей странице).
+    Возвращает (последние найденные колонки групп, строки таблиц до первой шапки, если columns не было) -
+    эти строки разбирает вызывающий, когда узнает шапку с предыдущих страниц"""
+    columns = dict(columns or {})
+    orphans, memo = [], {}
+    for page in pages:
+        for table in page_tables(page, memo):
+            if not columns:
+                head, table = split_before_header(table)
+                if head: orphans.append(head)
+                if not table: continue
+            columns = process_table(table, groups_data, columns)
+        #объекты страницы (символы, линии) больше не нужны - освобождаем сразу
+        page.close()
+    return columns, orphans
+
+def parse_pdf_pages(path, start, stop):
+    """Задача для исполнителя: распарсить страницы [start, stop) PDF-файла.
+    Возвращает (groups_data, общее число страниц, колонки групп, строки до первой шапки, пик RSS задачи в МиБ) -
+    число страниц нужно для разбиения больших PDF; строки без шапки и последние колонки нужны, чтобы по порядку
+    страниц отнести продолжения таблиц к группам из шапки на предыдущих частях"""
+    #в воркере пула задачи идут по одной - пик считаем с начала задачи; в потоках бота пик общий (сбрасывает движок)
+    if multiprocessing.parent_process() is not None: reset_peak_rss()
+    groups_data = empty_groups_data()
+    with pdfplumber.open(path) as pdf:
+        columns, orphans = extract_pages(pdf.pages[start:stop], groups_data)
+        return groups_data, len(pdf.pages), columns, orphans, peak_rss_mb()
+
+async def fetch_pdf(link):
+    """Скачивает PDF с условным запросом.
+    Возвращает (cached, None, None), если PDF не изменился (304 или тот же SHA-256),
+    иначе (None, path, validators): path - временный файл для парсинга (удаляет вызывающий).
+    Результат другой версии парсера - промах кеша: PDF скачивается целиком и разбирается заново"""
+    entry = await run_db(get_fetch_entry, link)
+    if entry and entry[4] != PARSER_VERSION: entry = None
+    response = await http_client.download(link, headers=conditional_headers(entry), timeout=PDF_TIMEOUT, suffix=".pdf")
+    if response.status == 304 and entry and entry[3]:
+        logger.info(f"PDF не изменился (304), парсинг пропущен: {link}")
+        return load_groups_data(entry[3]), None, None
+
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    digest = response.sha256
+    if entry and entry[2] == digest and entry[3]:
+        logger.info(f"PDF не изменился (хеш совпал), парсинг пропущен: {link}")
+        os.unlink(response.path)
+        await run_db(save_fetch_entry, link, etag, last_modified, digest, entry[3], response.size, PARSER_VERSION)
+        return load_groups_data(entry[3]), None, None
+    return None, response.path, (etag, last_modified, digest, response.size)
+
+def store_parsed_pdf(link, validators, groups_data):
+    etag, last_modified, digest, size = validators
+    save_fetch_entry(link, etag, last_modified, digest, json.dumps(groups_data, ensure_ascii=False), size, PARSER_VERSION)
@@ -0,0 +1,57 @@
+"""Отдельный процесс обновления расписания: парсит PDF и публикует снимок для front-end'ов (BOT_ROLE = "frontend")"""
+import time
+import asyncio
+import logging
+
+from config import REFRESHER_LOCK_FILE, SNAPSHOT_POLL_INTERVAL
+from database import init_db, close_db
+from snapshot import restore_schedule_cache
+from engine import shutdown_executor
+from http_client import http_client
+from tasks import safe_update_schedule_data, record_refresh_result
+from cluster import FileLock, take_refresh_request
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+async def wait_next_refresh(delay):
+    """Ждет delay секунд или до запроса внеочередного обновления от front-end"""
+    deadline = time.monotonic() + delay
+    while (remaining := deadline - time.monotonic()) > 0:
+        await asyncio.sleep(min(SNAPSHOT_POLL_INTERVAL, remaining))
+        if take_refresh_request():
+            logger.info("Запрошено внеочередное обновление")
+            return
+
+async def run():
+    init_db()
+    #с прошлым снимком в памяти первое обновление корректно определит, менялось ли расписание
+    restore_schedule_cache()
+    take_refresh_request()
+    try:
+        while True:
+            #снимок пишет update_schedule_data; front-end'ы подхватывают его по изменению файла
+            ok = await safe_update_schedule_data()
+            await wait_next_refresh(record_refresh_result(ok))
+    finally:
+        shutdown_executor()
+        await http_client.aclose()
+        close_db()
+
+def main():
+    lock = FileLock(REFRESHER_LOCK_FILE)
+    if not lock.try_acquire():
+        raise SystemExit("refresher.py уже запущен")
+    print("Refresher started")
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        lock.release()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import datetime
+from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import CLASS_TIMES
+from semester import day_info, nearest_study_day
+from cells import pair_title, pair_details, pair_summary
+
+DAY_NAMES_RU = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+
+#готовые тексты дней: (группа, четность, день недели, новый стиль) -> (текст до даты, текст после даты)
+#словарь целиком заменяется при каждом обновлении расписания
+render_cache = {}
+#недельный вид: (группа, четность, день недели) -> кортеж строк пар дня; (группа, новый стиль) -> шапка недели
+week_cache = {}
+
+#Telegram не принимает сообщения длиннее
+MAX_MESSAGE_LEN = 4096
+
+# ================= ПРЕДРЕНДЕР СООБЩЕНИЙ С РАСПИСАНИЕМ =================
+
+def get_day_name_ru(date_obj):
+    return DAY_NAMES_RU[date_obj.weekday()]
+
+def render_day(grp, pairs, parity, weekday, use_new_style, upd_time):
+    w_type = "Нижняя" if parity == 1 else "Верхняя"
+    day_name = DAY_NAMES_RU[weekday]
+    if use_new_style:
+        head = f"<tg-emoji emoji-id='5274055917766202507'>🗓</tg-emoji> <b>{day_name}</b> | "
+        text = f"\n<tg-emoji emoji-id='5375163339154399459'>🎓</tg-emoji> {grp} ({w_type})\n<tg-emoji emoji-id='5451646226975955576'>⌛️</tg-emoji> Обновлено: {upd_time}\n{'='*25}"
+    else:
+        head = f"🗓 <b>{day_name}</b> | "
+        text = f"\n🎓 {grp} ({w_type})\n🕒 Обновлено: {upd_time}\n{'='*25}"
+
+    if not pairs:
+        text += ("\n<tg-emoji emoji-id='5404743771059395517'>😴</tg-emoji> Пар нет!" if use_new_style else "\n😴 Пар нет!")
+    else:
+        for p in sorted(pairs.keys()):
+            times = CLASS_TIMES.get(p)
+            t_str = f"{times['start'][0]:02}:{times['start'][1]:02} - {times['end'][0]:02}:{times['end'][1]:02}" if times else "??"
+            pair = pairs[p]
+            if use_new_style:
+                text += f"\n\n<tg-emoji emoji-id='5413704112220949842'>⏰</tg-emoji> <b>{t_str}</b>\n<tg-emoji emoji-id='5373098009640836781'>📚</tg-emoji> {pair_title(pair)}"
+            else:
+                text += f"\n\n⏰ <b>{t_str}</b>\n📚 {pair_title(pair)}"
+            details = pair_details(pair)
+            if details: text += f"\n{details}"
+    return head, text
+
+def render_week_day(pairs):
+    """Пары дня для недельного вида: одна строка на пару (каждая строка - законченный HTML)"""
+    if not pairs: return ("😴 Пар нет",)
+    lines = []
+    for p in sorted(pairs.keys()):
+        times = CLASS_TIMES.get(p)
+        t_str = f"{times['start'][0]:02}:{times['start'][1]:02}" if times else "??"
+        lines.append(f"<b>{t_str}</b> {pair_summary(pairs[p])}")
+    return tuple(lines)
+
+def rebuild_render_cache(snap):
+    """Предрендер всех дней всех групп; вызывается при каждой смене текущей версии расписания"""
+    global render_cache, week_cache
+    upd_time = snap.last_update.strftime('%d.%m %H:%M') if snap.last_update else "Неизвестно"
+    new_cache, new_week_cache = {}, {}
+    for grp, grp_data in snap.data.items():
+        for parity in (0, 1):
+            for weekday in range(6):
+                pairs = grp_data.get(parity, {}).get(weekday, {})
+                for use_new_style in (False, True):
+                    new_cache[(grp, parity, weekday, use_new_style)] = render_day(grp, pairs, parity, weekday, use_new_style, upd_time)
+                new_week_cache[(grp, parity, weekday)] = render_week_day(pairs)
+        new_week_cache[(grp, False)] = f"\n🎓 {grp}\n🕒 Обновлено: {upd_time}\n{'='*25}"
+        new_week_cache[(grp, True)] = f"\n<tg-emoji emoji-id='5375163339154399459'>🎓</tg-emoji> {grp}\n<tg-emoji emoji-id='5451646226975955576'>⌛️</tg-emoji> Обновлено: {upd_time}\n{'='*25}"
+    render_cache, week_cache = new_cache, new_week_cache
+
+def get_rendered_day(grp, info, target_date, use_new_style):
+    """Готовый текст дня (info - semester.DayInfo даты) с подставленной датой или None, если группы нет в расписании"""
+    parts = render_cache.get((grp, info.parity, info.weekday, use_new_style))
+    if parts is None: return None
+    return parts[0] + target_date.strftime('%d.%m') + parts[1]
+
+def week_start(date):
+    return date - datetime.timedelta(days=date.weekday())
+
+def get_rendered_week(grp, monday, use_new_style):
+    """Неделя с понедельника monday (пн - сб) из предрендера; праздники и переносы - по календарю семестра.
+    None, если группы нет в расписании"""
+    cache = week_cache
+    head = cache.get((grp, use_new_style))
+    if head is None: return None
+    saturday = monday + datetime.timedelta(days=5)
+    icon = "<tg-emoji emoji-id='5274055917766202507'>🗓</tg-emoji>" if use_new_style else "🗓"
+    head = f"{icon} <b>Неделя {monday:%d.%m} - {saturday:%d.%m}</b>{head}"
+    days = []
+    for i in range(6):
+        date = monday + datetime.timedelta(days=i)
+        info = day_info(date)
+        w_type = "Нижняя" if info.parity == 1 else "Верхняя"
+        title = f"\n\n<b>{DAY_NAMES_RU[i]}</b>, {date:%d.%m}"
+        if not info.is_study_day:
+            days.append((title, ("🎉 Выходной",)))
+            continue
+        title += f" ({w_type})"
+        if info.weekday != i: title += f", по расписанию: {DAY_NAMES_RU[info.weekday].lower()}"
+        days.append((title, cache.get((grp, info.parity, info.weekday), ("😴 Пар нет",))))
+    return fit_week(head, days)
+
+def join_week(head, days, cut):
+    parts = [head]
+    for (title, lines), n in zip(days, cut):
+        shown = list(lines[:len(lines) - n])
+        if n: shown.append(f"✂️ Еще пар: {n} - смотрите расписание на день")
+        parts.append(title + "\n" + "\n".join(shown))
+    return "".join(parts)
+
+def fit_week(head, days):
+    """Неделя в лимит сообщения: у самого длинного дня убираются последние строки (с пометкой), пока текст
+    не поместится. Режется только по границам строк - HTML-теги остаются закрытыми, ни один день не пропадает"""
+    cut = [0] * len(days)
+    text = join_week(head, days, cut)
+    while len(text) > MAX_MESSAGE_LEN:
+        left = [sum(map(len, lines[:len(lines) - n])) for (_, lines), n in zip(days, cut)]
+        longest = max(range(len(days)), key=left.__getitem__)
+        if not left[longest]: break
+        cut[longest] += 1
+        text = join_week(head, days, cut)
+    return text
+
+def week_markup(monday, today, use_new_style):
+    prev_cb = f"week_{(monday - datetime.timedelta(days=7)):%Y-%m-%d}"
+    next_cb = f"week_{(monday + datetime.timedelta(days=7)):%Y-%m-%d}"
+    today_cb = f"sched_{today:%Y-%m-%d}"
+    if use_new_style:
+        kb = [
+            [InlineKeyboardButton("⬅️ Пред. неделя", callback_data=prev_cb, api_kwargs={"style": "primary"}),
+             InlineKeyboardButton("След. неделя ➡️", callback_data=next_cb, api_kwargs={"style": "primary"})],
+            [InlineKeyboardButton("Сегодня", callback_data=today_cb, api_kwargs={"icon_custom_emoji_id": "5274055917766202507"}),
+             InlineKeyboardButton("📥 Календарь .ics", callback_data="ics")]
+        ]
+    else:
+        kb = [
+            [InlineKeyboardButton("⬅️ Пред. неделя", callback_data=prev_cb),
+             InlineKeyboardButton("След. неделя ➡️", callback_data=next_cb)],
+            [InlineKeyboardButton("📅 Сегодня", callback_data=today_cb),
+             InlineKeyboardButton("📥 Календарь .ics", callback_data="ics")]
+        ]
+    return InlineKeyboardMarkup(kb)
+
+def navigation_markup(target_date, today, use_new_style):
+    #воскресенья, праздники и каникулы пропускаются
+    prev_date = nearest_study_day(target_date - datetime.timedelta(days=1), -1)
+    next_date = nearest_study_day(target_date + datetime.timedelta(days=1), 1)
+
+    prev_cb = f"sched_{prev_date.strftime('%Y-%m-%d')}"
+    next_cb = f"sched_{next_date.strftime('%Y-%m-%d')}"
+    today_cb = f"sched_{today.strftime('%Y-%m-%d')}"
+    week_cb = f"week_{week_start(target_date):%Y-%m-%d}"
+
+    if use_new_style:
+        kb = [
+            [InlineKeyboardButton(f"⬅️ {get_day_name_ru(prev_date)}", callback_data=prev_cb, api_kwargs={"style": "primary"}),
+             InlineKeyboardButton(f"{get_day_name_ru(next_date)} ➡️", callback_data=next_cb, api_kwargs={"style": "primary"})],
+            [InlineKeyboardButton("Сегодня", callback_data=today_cb, api_kwargs={"icon_custom_emoji_id": "5274055917766202507"}),
+             InlineKeyboardButton("🗓 Вся неделя", callback_data=week_cb)]
+        ]
+    else:
+        kb = [
+            [InlineKeyboardButton(f"⬅️ {get_day_name_ru(prev_date)}", callback_data=prev_cb),
+             InlineKeyboardButton(f"{get_day_name_ru(next_date)} ➡️", callback_data=next_cb)],
+            [InlineKeyboardButton("📅 Сегодня", callback_data=today_cb),
+             InlineKeyboardButton("🗓 Вся неделя", callback_data=week_cb)]
+        ]
+    return InlineKeyboardMarkup(kb)
@@ -0,0 +1,130 @@
+import re
+import base64
+import datetime
+
+from config import CLASS_TIMES
+from render import DAY_NAMES_RU
+from cells import pair_summary
+
+#короткие и полные названия дней недели в запросах
+WEEKDAY_WORDS = {
+    "пн": 0, "понедельник": 0, "вт": 1, "вторник": 1, "ср": 2, "среда": 2, "чт": 3, "четверг": 3,
+    "пт": 4, "пятница": 4, "сб": 5, "суббота": 5,
+}
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+DATE_RE = re.compile(r"^(\d{1,2})\.(\d{1,2})$")
+#сколько совпадений по тексту ячеек отдавать на один запрос
+MAX_MATCHES = 20
+
+# ================= ИНДЕКС РАСПИСАНИЯ ДЛЯ INLINE-ЗАПРОСОВ И DEEP LINK =================
+
+def group_key(text):
+    return re.sub(r"[\s\-_]", "", text).upper()
+
+def encode_group(grp):
+    """Группа в payload deep link (/start g_...): только [A-Za-z0-9_-], до 64 символов"""
+    return "g_" + base64.urlsafe_b64encode(grp.encode()).decode().rstrip("=")
+
+def decode_group(payload):
+    if not payload.startswith("g_"): return None
+    raw = payload[2:]
+    try:
+        return base64.urlsafe_b64decode(raw + "=" * (-len(raw) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+class ScheduleIndex:
+    """Группы по нормализованному названию и ячейки по тексту (предмет, преподаватель, аудитория).
+    Обновляется по версиям хранилища: перестраиваются только дни, объект которых сменился"""
+
+    def __init__(self):
+        self.version = None
+        #(группа, неделя, день) -> замороженный день из store
+        self.days = {}
+        #исходный текст ячейки в нижнем регистре -> {(группа, неделя, день, пара)}
+        self.postings = {}
+        #нормализованное название -> группа
+        self.groups = {}
+
+    def _drop_day(self, key, day):
+        for pair, cell in day.items():
+            lowered = cell.text.lower()
+            locations = self.postings.get(lowered)
+            if locations is None: continue
+            locations.discard(key + (pair,))
+            if not locations: del self.postings[lowered]
+
+    def _add_day(self, key, day):
+        for pair, cell in day.items():
+            self.postings.setdefault(cell.text.lower(), set()).add(key + (pair,))
+
+    def update(self, snap):
+        """Приводит индекс к версии snap; возвращает число перестроенных дней"""
+        if snap.version == self.version: return 0
+        new_days = {
+            (g, w, d): day
+            for g, weeks in snap.data.items()
+            for w, days in weeks.items()
+            for d, day in days.items()
+        }
+        rebuilt = 0
+        for key, day in list(self.days.items()):
+            if new_days.get(key) is not day:
+                self._drop_day(key, day)
+                del self.days[key]
+        for key, day in new_days.items():
+            if key not in self.days:
+                self._add_day(key, day)
+                self.days[key] = day
+                rebuilt += 1
+        self.groups = {group_key(g): g for g in snap.data}
+        self.version = snap.version
+        return rebuilt
+
+    def find_group(self, text):
+        return self.groups.get(group_key(text))
+
+    def search(self, needle, group=None, parity=None, weekday=None, limit=MAX_MATCHES):
+        """Пары, текст которых содержит needle: [(группа, неделя, день, пара, Pair)] в порядке расписания"""
+        needle = needle.lower()
+        found = []
+        for lowered, locations in self.postings.items():
+            if needle not in lowered: continue
+            for g, w, d, p in locations:
+                if group and g != group: continue
+                if parity is not None and w != parity: continue
+                if weekday is not None and d != weekday: continue
+                found.append((g, w, d, p, self.days[(g, w, d)][p]))
+        found.sort(key=lambda m: (m[0], m[1], m[2], m[3]))
+        return found[:limit]
+
+schedule_index = ScheduleIndex()
+
+def parse_query(text, index, today):
+    """Разбор запроса вида "Б-ПИ-102 завтра физика": (группа, дата или None, день недели или None, остаток текста)"""
+    group, date, weekday, rest = None, None, None, []
+    for word in text.split():
+        lowered = word.lower()
+        if group is None and index.find_group(word):
+            group = index.find_group(word)
+        elif lowered in RELATIVE_DAYS:
+            date = today + datetime.timedelta(days=RELATIVE_DAYS[lowered])
+        elif lowered in WEEKDAY_WORDS:
+            weekday = WEEKDAY_WORDS[lowered]
+        elif DATE_RE.match(lowered):
+            day, month = map(int, DATE_RE.match(lowered).groups())
+            try: date = datetime.date(today.year, month, day)
+            except ValueError: rest.append(word)
+        else:
+            rest.append(word)
+    if weekday is not None and date is None:
+        #ближайший такой день недели начиная с сегодня
+        date = today + datetime.timedelta(days=(weekday - today.weekday()) % 7)
+    return group, date, weekday, " ".join(rest)
+
+def describe_match(match):
+    g, w, d, p, cell = match
+    times = CLASS_TIMES.get(p)
+    t_str = f"{times['start'][0]:02}:{times['start'][1]:02}" if times else "??"
+    w_type = "Нижняя" if w == 1 else "Верхняя"
+    return f"{g} · {DAY_NAMES_RU[d]} ({w_type}), {p} пара ({t_str})", pair_summary(cell)
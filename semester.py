@@ -0,0 +1,70 @@
+import os
+import json
+import datetime
+import logging
+from collections import namedtuple
+
+from config import SEMESTER_START_DATE, SEMESTER_END_DATE, CALENDAR_OVERRIDES_FILE
+
+logger = logging.getLogger(__name__)
+
+#parity и weekday - по какому расписанию идут занятия в этот день (при переносе - по расписанию другого дня)
+DayInfo = namedtuple("DayInfo", ["parity", "weekday", "is_study_day"])
+
+#дата -> DayInfo на весь семестр; строится один раз при старте (load_calendar)
+calendar_index = {}
+
+#сколько дней максимум искать ближайший учебный день (длинные каникулы)
+MAX_DAYS_SKIP = 21
+
+# ================= КАЛЕНДАРЬ СЕМЕСТРА =================
+
+def plain_day(date):
+    """День без учета праздников и переносов: четность от начала семестра, воскресенье - выходной"""
+    return DayInfo(((date - SEMESTER_START_DATE).days // 7) % 2, date.weekday(), date.weekday() != 6)
+
+def load_overrides(path):
+    """Праздники и переносы из JSON:
+    {"holidays": ["2026-02-23"], "transfers": {"2026-03-07": "2026-03-09"}}
+    transfers: в дату-ключ занятия идут по расписанию даты-значения"""
+    if not os.path.exists(path): return set(), {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+        holidays = {datetime.date.fromisoformat(d) for d in raw.get("holidays", [])}
+        transfers = {datetime.date.fromisoformat(d): datetime.date.fromisoformat(src) for d, src in raw.get("transfers", {}).items()}
+    except (OSError, ValueError, AttributeError) as e:
+        logger.error(f"Файл праздников и переносов {path} не прочитан: {e}")
+        return set(), {}
+    return holidays, transfers
+
+def build_calendar(start, end, holidays=(), transfers=None):
+    index = {}
+    day = start
+    while day <= end:
+        index[day] = plain_day(day)
+        day += datetime.timedelta(days=1)
+    for day, src in (transfers or {}).items():
+        info = plain_day(src)
+        index[day] = DayInfo(info.parity, info.weekday, True)
+    for day in holidays:
+        index[day] = index.get(day, plain_day(day))._replace(is_study_day=False)
+    return index
+
+def load_calendar(path=CALENDAR_OVERRIDES_FILE):
+    global calendar_index
+    holidays, transfers = load_overrides(path)
+    calendar_index = build_calendar(SEMESTER_START_DATE, SEMESTER_END_DATE, holidays, transfers)
+    logger.info(f"Календарь семестра: {len(calendar_index)} дней, праздников: {len(holidays)}, переносов: {len(transfers)}")
+
+def day_info(date):
+    """O(1) по индексу; даты вне семестра считаются на лету"""
+    return calendar_index.get(date) or plain_day(date)
+
+def nearest_study_day(date, step=1):
+    """Сам date, если он учебный, иначе ближайший учебный день в направлении step (+1 / -1)"""
+    probe = date
+    for _ in range(MAX_DAYS_SKIP):
+        if day_info(probe).is_study_day: return probe
+        probe += datetime.timedelta(days=step)
+    return date
@@ -0,0 +1,60 @@
+import os
+import gzip
+import json
+import datetime
+import logging
+
+from config import SNAPSHOT_FILE, TZ_SARATOV
+from parser import decode_groups_data
+from render import rebuild_render_cache
+from search import schedule_index
+from store import schedule_store
+
+logger = logging.getLogger(__name__)
+
+#версия формата файла; при несовпадении снимок игнорируется
+SNAPSHOT_VERSION = 1
+
+# ================= СНИМОК РАСПИСАНИЯ НА ДИСКЕ =================
+
+def save_snapshot(data, last_update, pdf_hashes):
+    """Атомарно сохраняет итоговое расписание (gzip + компактный JSON)"""
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "last_update": last_update.isoformat() if last_update else None,
+        "pdf_hashes": pdf_hashes,
+        "data": data,
+    }
+    tmp_file = SNAPSHOT_FILE + ".tmp"
+    with gzip.open(tmp_file, "wt", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_file, SNAPSHOT_FILE)
+
+def load_snapshot():
+    """Читает снимок с диска. Возвращает dict или None, если файла нет или формат устарел"""
+    if not os.path.exists(SNAPSHOT_FILE): return None
+    try:
+        with gzip.open(SNAPSHOT_FILE, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Снимок расписания поврежден: {e}")
+        return None
+    if payload.get("version") != SNAPSHOT_VERSION:
+        logger.warning(f"Снимок расписания устаревшей версии {payload.get('version')}, пропускаю.")
+        return None
+    last_update = payload.get("last_update")
+    return {
+        "last_update": datetime.datetime.fromisoformat(last_update).astimezone(TZ_SARATOV) if last_update else None,
+        "pdf_hashes": payload.get("pdf_hashes") or {},
+        "data": decode_groups_data(payload.get("data") or {}),
+    }
+
+def restore_schedule_cache():
+    """Публикует расписание из снимка первой версией хранилища. Вызывается синхронно до запуска бота"""
+    snap = load_snapshot()
+    if not snap or not snap["data"]: return False
+    published = schedule_store.publish(snap["data"], snap["last_update"], snap["pdf_hashes"])
+    rebuild_render_cache(published)
+    schedule_index.update(published)
+    logger.info(f"Расписание восстановлено из снимка от {snap['last_update']}")
+    return True
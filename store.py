@@ -0,0 +1,118 @@
+import sys
+import itertools
+import threading
+from collections import deque, namedtuple
+from types import MappingProxyType
+
+from config import SCHEDULE_HISTORY_SIZE
+from cells import Day, EMPTY_DAY, CellPool
+
+#одна опубликованная версия расписания; все поля неизменяемы (MappingProxyType поверх словарей,
+#которые никто больше не видит, и Day), поэтому читатели берут store.current один раз и работают без блокировок
+ScheduleSnapshot = namedtuple("ScheduleSnapshot", ["version", "data", "last_update", "pdf_hashes"])
+
+EMPTY = MappingProxyType({})
+EMPTY_SNAPSHOT = ScheduleSnapshot(0, EMPTY, None, EMPTY)
+
+# ================= ВЕРСИОНИРУЕМОЕ ХРАНИЛИЩЕ РАСПИСАНИЯ =================
+
+def intern_key(text):
+    return sys.intern(text) if isinstance(text, str) else text
+
+def same_data(a, b):
+    """Одинаковое расписание: те же группы, недели и дни, дни - те же объекты Day из пула"""
+    if a.keys() != b.keys(): return False
+    for g, weeks in a.items():
+        other_weeks = b[g]
+        if weeks.keys() != other_weeks.keys(): return False
+        for w, days in weeks.items():
+            other_days = other_weeks[w]
+            if days.keys() != other_days.keys(): return False
+            if any(day is not other_days[d] for d, day in days.items()): return False
+    return True
+
+class ScheduleStore:
+    """Публикует замороженные версии расписания заменой одной ссылки и хранит последние N версий.
+    Ячейки разбираются в Pair один раз; одинаковые ячейки и дни (в том числе между версиями и группами) -
+    один и тот же объект, поэтому сравнение версий идет по ссылкам"""
+
+    def __init__(self, history_size=SCHEDULE_HISTORY_SIZE):
+        self.current = EMPTY_SNAPSHOT
+        #последняя опубликованная версия; после /rollback current указывает на более старую
+        self.latest = EMPTY_SNAPSHOT
+        self.history = deque(maxlen=history_size)
+        self._versions = itertools.count(1)
+        #слоты дня -> Day и разобранные ячейки; только из хранимых версий
+        self._day_pool = {}
+        self._cells = CellPool()
+        #сериализует писателей; читателям блокировка не нужна
+        self._write_lock = threading.Lock()
+
+    def _freeze(self, data):
+        pool = self._day_pool
+        frozen = {}
+        for g, weeks in (data or {}).items():
+            frozen_weeks = {}
+            for w, days in weeks.items():
+                frozen_days = {}
+                for d, pairs in days.items():
+                    slots = self._cells.day(pairs)
+                    day = pool.get(slots) if slots else EMPTY_DAY
+                    if day is None: day = pool[slots] = Day(slots)
+                    frozen_days[d] = day
+                frozen_weeks[w] = MappingProxyType(frozen_days)
+            frozen[intern_key(g)] = MappingProxyType(frozen_weeks)
+        return MappingProxyType(frozen)
+
+    def _prune_pool(self):
+        """Оставляет в пулах только дни и ячейки, на которые ссылаются хранимые версии"""
+        live_days, live_cells = {}, set()
+        for snap in self.history:
+            for weeks in snap.data.values():
+                for days in weeks.values():
+                    for day in days.values():
+                        if day.slots in live_days: continue
+                        live_days[day.slots] = day
+                        live_cells.update(id(cell) for cell in day.slots if cell is not None)
+        self._day_pool = live_days
+        self._cells.retain(live_cells)
+
+    def publish(self, data, last_update, pdf_hashes=None):
+        """Замораживает data (вложенные словари с текстом ячеек, как после парсинга) и делает ее текущей версией.
+        Если data не отличается от последней опубликованной версии, новая версия не создается: у последней
+        обновляются только last_update и pdf_hashes, а откат (/rollback) остается в силе.
+        Возвращает последнюю опубликованную версию"""
+        with self._write_lock:
+            frozen = self._freeze(data)
+            pdf_hashes = MappingProxyType(dict(pdf_hashes or {}))
+            latest = self.latest
+            if self.history and same_data(latest.data, frozen):
+                snap = latest._replace(last_update=last_update, pdf_hashes=pdf_hashes)
+                self.history[-1] = snap
+                if self.current is latest: self.current = snap
+            else:
+                snap = ScheduleSnapshot(next(self._versions), frozen, last_update, pdf_hashes)
+                self.history.append(snap)
+                self.current = snap
+            self.latest = snap
+            self._prune_pool()
+            return snap
+
+    def get(self, version):
+        for snap in self.history:
+            if snap.version == version: return snap
+        return None
+
+    def previous(self):
+        """Версия, опубликованная перед текущей (для сравнения), или None"""
+        older = [snap for snap in self.history if snap.version < self.current.version]
+        return older[-1] if older else None
+
+    def rollback(self, version=None):
+        """Снова делает текущей одну из хранимых версий (по умолчанию - предыдущую). Возвращает ее или None"""
+        with self._write_lock:
+            snap = self.get(version) if version is not None else self.previous()
+            if snap is not None: self.current = snap
+            return snap
+
+schedule_store = ScheduleStore()
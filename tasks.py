@@ -1,27 +1,43 @@
+import time
 import asyncio
 import datetime
 import logging
-import sqlite3
-from concurrent.futures import ThreadPoolExecutor
-from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from config import TZ_SARATOV, schedule_cache, CLASS_TIMES, DB_FILE, MAX_WORKERS
-from database import get_users_for_change_notification
-from parser import find_all_pdf_links, parse_pdf_task, is_schedule_changed, get_week_parity
+from config import (
+    TZ_SARATOV, CLASS_TIMES, MAX_WORKERS, PARSE_EXECUTOR, SEMESTER_START_DATE,
+    REFRESH_MIN_INTERVAL, REFRESH_HOT_MAX_INTERVAL, REFRESH_MAX_INTERVAL, REFRESH_RETRY_INTERVAL,
+    REFRESH_HOT_HOURS, REFRESH_SEMESTER_HOT_DAYS, BOT_ROLE, SNAPSHOT_FILE
+)
+from database import get_users_for_change_notification, get_users_for_class_notification, get_fetch_hashes, run_db, sync_profiles
+from crawler import find_all_pdf_links
+from semester import day_info
+from diff import diff_schedules, format_changes
+from cells import pair_summary
+from engine import process_all_pdfs, peak_rss_mb
+from snapshot import save_snapshot, load_snapshot
+from broadcast import broadcast
+from render import rebuild_render_cache
+from search import schedule_index
+from store import schedule_store
+from cluster import notifier_lock, file_stamp
+from metrics import timer, inc, observe
 
 logger = logging.getLogger(__name__)
 update_lock = asyncio.Lock()
+#состояние адаптивного планировщика обновлений
+refresh_state = {"unchanged": 0, "failures": 0, "last_changed": False}
 
 # ================= АСИНХРОННАЯ ОБРАТКА (ЛОГИКА ОБНОВЛЕНИЯ) =================
 
-async def notify_users_about_change(context: ContextTypes.DEFAULT_TYPE):
-    users = get_users_for_change_notification()
+async def notify_users_about_change(context: ContextTypes.DEFAULT_TYPE, changes):
+    """Каждому пользователю - только изменения его группы"""
+    users = await run_db(get_users_for_change_notification)
     if not users: return
-    msg = "⚠️ <b>Внимание! Расписание изменилось.</b>"
-    for uid in users:
-        try: await context.bot.send_message(uid, msg, parse_mode=ParseMode.HTML)
-        except: pass
+    messages = {grp: format_changes(grp, group_changes) for grp, group_changes in changes.items()}
+    result = await broadcast(context.bot, ((uid, messages[grp]) for uid, grp in users if grp in messages))
+    logger.info(f"Уведомление об изменении расписания: {result}")
+    if result.blocked: await schedule_notifier(context.job_queue)
 
 async def update_schedule_data(context: ContextTypes.DEFAULT_TYPE = None):
 
@@ -33,76 +49,269 @@ async def update_schedule_data(context: ContextTypes.DEFAULT_TYPE = None):
 
         
         logger.info("Поиск PDF на странице университета...")
-        links = await asyncio.to_thread(find_all_pdf_links)
+        refresh_start = time.perf_counter()
+        with timer("refresh.links"):
+            links = await find_all_pdf_links()
         
         if not links: 
             logger.warning("Ссылки на PDF не найдены.")
+            inc("refresh.failed")
             return False
             
-        logger.info(f"Найдено ссылок на PDF: {len(links)}. Начинаем параллельную обработку ({MAX_WORKERS} потоков)...")
+        logger.info(f"Найдено ссылок на PDF: {len(links)}. Начинаем параллельную обработку ({PARSE_EXECUTOR}, {MAX_WORKERS} воркеров)...")
 
         
-        loop = asyncio.get_running_loop()
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            tasks = [loop.run_in_executor(executor, parse_pdf_task, ln) for ln in links]
-            results = await asyncio.gather(*tasks)
-        
-        
-        final_data = { "Б-ПИ-101": {0: {}, 1: {}}, "Б-ПИ-102": {0: {}, 1: {}} }
-        
-        success_count = 0
-        for res in results:
-            if not res: continue
-            success_count += 1
-            for g in final_data: # g = Группа
-                for w in [0, 1]: # w = Неделя
-                    for day_idx, pairs in res[g][w].items():
-                        if day_idx not in final_data[g][w]: 
-                            final_data[g][w][day_idx] = {}
-                        final_data[g][w][day_idx].update(pairs)
+        final_data, success_count = await process_all_pdfs(links)
+        own_rss, children_rss = peak_rss_mb()
+        logger.info(f"Обработано PDF: {success_count}/{len(links)}. Пиковый RSS: бот {own_rss:.0f} МиБ, воркеры {children_rss:.0f} МиБ")
 
         if success_count > 0:
-            old_data = schedule_cache.get('data')
-            changed = is_schedule_changed(old_data, final_data)
-            
-            schedule_cache['data'] = final_data
-            schedule_cache['last_update'] = datetime.datetime.now(TZ_SARATOV)
-            
-           
+            try:
+                pdf_hashes = await run_db(get_fetch_hashes, links)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать хеши PDF: {e}")
+                pdf_hashes = {}
 
-            if changed and old_data and context:
-                await notify_users_about_change(context)
+            #сравнение - с последней опубликованной версией, а не с текущей: после /rollback
+            #неизменное расписание не публикуется заново и не рассылается как изменение
+            old = schedule_store.latest
+            with timer("refresh.publish"):
+                snap = schedule_store.publish(final_data, datetime.datetime.now(TZ_SARATOV), pdf_hashes)
+            changed = snap.version != old.version
+            with timer("refresh.diff"):
+                changes = diff_schedules(old.data, snap.data) if changed else {}
+            refresh_state["last_changed"] = changed
+            current = schedule_store.current
+            with timer("refresh.render"):
+                rebuild_render_cache(current)
+            with timer("refresh.index"):
+                schedule_index.update(current)
+
+            try:
+                await asyncio.to_thread(save_snapshot, final_data, snap.last_update, pdf_hashes)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить снимок расписания: {e}")
+
+            if changed and context:
+                await schedule_notifier(context.job_queue)
+            if changes and old.data and context:
+                await notify_users_about_change(context, changes)
+            observe("refresh.total", time.perf_counter() - refresh_start)
+            inc("refresh.ok")
             return True
             
+        inc("refresh.failed")
+        return False
+
+# ================= АДАПТИВНОЕ РАСПИСАНИЕ ОБНОВЛЕНИЙ =================
+
+def is_hot_time(now):
+    """Время, когда изменения расписания наиболее вероятны и нужны быстро"""
+    if abs((now.date() - SEMESTER_START_DATE).days) <= REFRESH_SEMESTER_HOT_DAYS: return True
+    if now.weekday() == 6: return now.hour >= 12  # вечер воскресенья - перед новой неделей
+    return REFRESH_HOT_HOURS[0] <= now.hour < REFRESH_HOT_HOURS[1]
+
+def seconds_until_hot(now):
+    """Через сколько секунд начнется ближайшее "горячее" время (шаг - час)"""
+    probe = now.replace(minute=0, second=0, microsecond=0)
+    for _ in range(48):
+        probe += datetime.timedelta(hours=1)
+        if is_hot_time(probe): return (probe - now).total_seconds()
+    return REFRESH_MAX_INTERVAL
+
+def next_refresh_delay(now, unchanged, failures):
+    if failures:
+        return min(REFRESH_RETRY_INTERVAL * 2 ** (failures - 1), REFRESH_MIN_INTERVAL)
+    if is_hot_time(now):
+        return min(REFRESH_MIN_INTERVAL * 2 ** unchanged, REFRESH_HOT_MAX_INTERVAL)
+    #ночью - редкий опрос, но не проспать начало учебного дня
+    delay = min(REFRESH_MIN_INTERVAL * 2 ** (unchanged + 2), REFRESH_MAX_INTERVAL)
+    return max(60, min(delay, seconds_until_hot(now)))
+
+def record_refresh_result(ok):
+    """Учитывает итог обновления и возвращает задержку до следующего (сек)"""
+    if not ok:
+        refresh_state["failures"] += 1
+    else:
+        refresh_state["failures"] = 0
+        refresh_state["unchanged"] = 0 if refresh_state["last_changed"] else refresh_state["unchanged"] + 1
+    delay = next_refresh_delay(datetime.datetime.now(TZ_SARATOV), refresh_state["unchanged"], refresh_state["failures"])
+    logger.info(f"Следующее обновление через {delay / 60:.0f} мин (без изменений подряд: {refresh_state['unchanged']}, ошибок подряд: {refresh_state['failures']})")
+    return delay
+
+async def safe_update_schedule_data(context: ContextTypes.DEFAULT_TYPE = None):
+    """update_schedule_data, у которой исключение считается неудачным обновлением"""
+    try:
+        return await update_schedule_data(context)
+    except Exception as e:
+        logger.exception(f"Обновление расписания упало: {e}")
+        inc("refresh.failed")
         return False
 
+async def refresh_job(context: ContextTypes.DEFAULT_TYPE):
+    """Обновление расписания, которое само планирует следующий запуск (в том числе после ошибки)"""
+    ok = False
+    try:
+        ok = await safe_update_schedule_data(context)
+    finally:
+        context.job_queue.run_once(refresh_job, record_refresh_result(ok), name="refresh")
+
+# ================= FRONT-END: СНИМКИ ОТ REFRESHER.PY =================
+
+#отпечаток последнего просмотренного файла снимка
+snapshot_watch = {"stamp": None}
+
+def is_notifier_leader():
+    """Уведомления шлет один процесс: standalone-бот всегда, из front-end'ов - держатель блокировки"""
+    return BOT_ROLE == "standalone" or notifier_lock.held
+
+async def reload_snapshot(context: ContextTypes.DEFAULT_TYPE):
+    """Публикует новый снимок refresher.py; лидер перестраивает notifier и рассылает изменения"""
+    snap_file = await asyncio.to_thread(load_snapshot)
+    if not snap_file or not snap_file["data"]: return
+    old = schedule_store.latest
+    if snap_file["last_update"] == old.last_update: return
+    with timer("refresh.publish"):
+        snap = schedule_store.publish(snap_file["data"], snap_file["last_update"], snap_file["pdf_hashes"])
+    changed = snap.version != old.version
+    changes = diff_schedules(old.data, snap.data) if changed else {}
+    current = schedule_store.current
+    rebuild_render_cache(current)
+    schedule_index.update(current)
+    logger.info(f"Подхвачен снимок расписания от {snap.last_update} (версия {snap.version}, групп с изменениями: {len(changes)})")
+    if not is_notifier_leader() or not changed: return
+    await schedule_notifier(context.job_queue)
+    if changes and old.data:
+        await notify_users_about_change(context, changes)
+
+async def snapshot_watch_job(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически: лидерство notifier, кеш профилей после записей других процессов, новый снимок"""
+    became_leader = not notifier_lock.held and notifier_lock.try_acquire()
+    if became_leader: logger.info("Этот процесс теперь рассылает уведомления (notifier)")
+    db_changed = await run_db(sync_profiles)
+
+    stamp = file_stamp(SNAPSHOT_FILE)
+    if stamp != snapshot_watch["stamp"]:
+        snapshot_watch["stamp"] = stamp
+        await reload_snapshot(context)
+    if became_leader or (db_changed and notifier_lock.held):
+        await schedule_notifier(context.job_queue)
+
+#индекс уведомлений на сегодня: момент отправки -> {user_id: текст}; user_id -> его моменты отправки
+notify_index = {"date": None, "slots": {}, "by_user": {}}
+
+NOTIFY_TEMPLATES = (
+    (20, 2, "🔔 <b>20 мин до пары:</b>\n{}"),
+    (10, 3, "⚠️ <b>10 мин до пары:</b>\n{}"),
+    (5, 4, "🏃 <b>5 мин до пары:</b>\n{}"),
+)
+
+def user_notifications(u, data, info, now):
+    """Будущие уведомления на сегодня одного пользователя (строка get_users_for_class_notification): [(момент, текст)]"""
+    g_name = u[1]
+    if not g_name or not info.is_study_day: return []
+    today = now.date()
+    found = []
+    for p_num, subj in data.get(g_name, {}).get(info.parity, {}).get(info.weekday, {}).items():
+        times = CLASS_TIMES.get(p_num)
+        if not times: continue
+        h, m = times['start']
+        start_dt = TZ_SARATOV.localize(datetime.datetime.combine(today, datetime.time(h, m)))
+        for minutes, flag_idx, template in NOTIFY_TEMPLATES:
+            if not u[flag_idx]: continue
+            fire_at = start_dt - datetime.timedelta(minutes=minutes)
+            if fire_at > now: found.append((fire_at, template.format(pair_summary(subj))))
+    return found
+
+def drop_user_notifications(uid):
+    slots = notify_index["slots"]
+    for fire_at in notify_index["by_user"].pop(uid, ()):
+        batch = slots.get(fire_at)
+        if batch is None: continue
+        batch.pop(uid, None)
+        if not batch: del slots[fire_at]
+
+def index_user_notifications(users, now):
+    """Заменяет в индексе уведомления перечисленных пользователей; O(пар этих пользователей)"""
+    data = schedule_store.current.data
+    info = day_info(now.date())
+    slots, by_user = notify_index["slots"], notify_index["by_user"]
+    for u in users:
+        drop_user_notifications(u[0])
+        found = user_notifications(u, data, info, now) if data else []
+        for fire_at, text in found:
+            slots.setdefault(fire_at, {})[u[0]] = text
+        if found: by_user[u[0]] = {fire_at for fire_at, _ in found}
+
+def build_notify_index(now, users):
+    """Раскладывает все уведомления на сегодня по минутам (только будущие)"""
+    notify_index["date"] = now.date()
+    notify_index["slots"], notify_index["by_user"] = {}, {}
+    #в выходные и праздники индекс пуст, notifier просыпается только в 00:01 следующих суток
+    if day_info(now.date()).is_study_day: index_user_notifications(users, now)
+
+def arm_notifier(job_queue, now=None):
+    """Ставит notifier на ближайшую минуту, в которую есть что отправить (или на начало следующих суток)"""
+    now = now or datetime.datetime.now(TZ_SARATOV)
+    upcoming = [t for t in notify_index["slots"] if t > now]
+    if upcoming:
+        fire_at = min(upcoming)
+    else:
+        #пустой день: перестроить индекс в 00:01 следующих суток
+        tomorrow = now.date() + datetime.timedelta(days=1)
+        fire_at = TZ_SARATOV.localize(datetime.datetime.combine(tomorrow, datetime.time(0, 1)))
+    for job in job_queue.get_jobs_by_name("notifier"):
+        #уже стоит на нужную минуту - не трогаем
+        if job.data == (fire_at if upcoming else None) and job.next_t == fire_at: return
+        job.schedule_removal()
+    job_queue.run_once(notifier, when=fire_at, data=fire_at if upcoming else None, name="notifier")
+
+async def schedule_notifier(job_queue):
+    """Перестроить весь индекс (смена расписания или дня, изменения из других процессов) и перезапланировать notifier"""
+    if job_queue is None or not is_notifier_leader(): return
+    users = await run_db(get_users_for_class_notification)
+    now = datetime.datetime.now(TZ_SARATOV)
+    build_notify_index(now, users)
+    arm_notifier(job_queue, now)
+
+async def update_user_notifier(job_queue, user_ids):
+    """Пересчитать уведомления только этих пользователей (смена группы, настроек, /add, /del)"""
+    if job_queue is None or not is_notifier_leader(): return
+    now = datetime.datetime.now(TZ_SARATOV)
+    if notify_index["date"] != now.date():
+        await schedule_notifier(job_queue)
+        return
+    user_ids = list(user_ids)
+    rows = await run_db(get_users_for_class_notification, user_ids)
+    #у удаленных и лишенных доступа строки нет - их уведомления просто убираются
+    found = {u[0] for u in rows}
+    for uid in user_ids:
+        if uid not in found: drop_user_notifications(uid)
+    index_user_notifications(rows, now)
+    arm_notifier(job_queue, now)
+
 async def notifier(context: ContextTypes.DEFAULT_TYPE):
-    if not schedule_cache['data']: return
     now = datetime.datetime.now(TZ_SARATOV)
-    parity = get_week_parity()
-    with sqlite3.connect(DB_FILE) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id, group_name, notify_20, notify_10, notify_5 FROM users WHERE is_allowed = 1')
-        users = cursor.fetchall()
-    for u in users:
-        uid, g_name, n20, n10, n5 = u
-        if not g_name: continue
-        grp_data = schedule_cache['data'].get(g_name)
-        if not grp_data: continue
-        today_sched = grp_data.get(parity, {}).get(now.weekday(), {})
-        if not today_sched: continue
-        for p_num, times in CLASS_TIMES.items():
-            h, m = times['start']
-            start_dt = now.replace(hour=h, minute=m, second=0)
-            if now > start_dt: continue
-            minutes = int((start_dt - now).total_seconds() / 60)
-            subj = today_sched.get(p_num)
-            if not subj: continue
-            txt = None
-            if minutes == 20 and n20: txt = f"🔔 <b>20 мин до пары:</b>\n{subj}"
-            elif minutes == 10 and n10: txt = f"⚠️ <b>10 мин до пары:</b>\n{subj}"
-            elif minutes == 5 and n5: txt = f"🏃 <b>5 мин до пары:</b>\n{subj}"
-            if txt:
-                try: await context.bot.send_message(uid, txt, parse_mode=ParseMode.HTML)
-                except: pass
+    if notify_index["date"] != now.date():
+        await schedule_notifier(context.job_queue)
+        return
+    fire_at = context.job.data
+    batch = notify_index["slots"].pop(fire_at, {}) if fire_at else {}
+    for uid in batch: notify_index["by_user"].get(uid, set()).discard(fire_at)
+    arm_notifier(context.job_queue, now)
+    if not batch: return
+    result = await broadcast(context.bot, list(batch.items()))
+    logger.info(f"Уведомления о парах ({fire_at:%H:%M}): {result}")
+    if result.blocked: await schedule_notifier(context.job_queue)
 
+async def notifier_watchdog(context: ContextTypes.DEFAULT_TYPE):
+    """Периодическая страховка: индекс на сегодня и запланированный notifier есть, даже если запуск был пропущен или упал"""
+    if not is_notifier_leader(): return
+    now = datetime.datetime.now(TZ_SARATOV)
+    if notify_index["date"] != now.date():
+        await schedule_notifier(context.job_queue)
+        return
+    #пропущенные минуты (бот спал, запуск упал) больше не отправляем
+    for fire_at in [t for t in notify_index["slots"] if t <= now]:
+        for uid in notify_index["slots"].pop(fire_at): notify_index["by_user"].get(uid, set()).discard(fire_at)
+    arm_notifier(context.job_queue, now)